@@ -0,0 +1,210 @@
+from sqlalchemy import URL, Select, func, make_url, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, async_sessionmaker
+from collections.abc import AsyncIterator, Iterable
+import pyarrow as pa
+import asyncio
+import time
+
+from engine import get_async_engine
+from model import (
+    AuthBase,
+    Base,
+    BulkInsertReport,
+    CountMode,
+    Student,
+    StudentOrder,
+    StudentRow,
+    _STUDENT_COLUMNS,
+    _batched,
+    _bulk_insert_stmt,
+    _count_cache,
+    _count_cache_ttl,
+    _find_students_stmt,
+    _students_page_stmt,
+    _students_table,
+    default_db_url
+)
+
+
+class AsyncDBWorker:
+
+    def __init__(self, url: URL | str | None = None) -> None:
+        self._DB_URL = make_url(url) if url is not None else default_db_url()
+
+    # Resolved on every use: each event loop (each asyncio.run) gets its own
+    # engine, so the worker can be shared across loops, e.g. Streamlit reruns
+    @property
+    def _engine(self) -> AsyncEngine:
+        return get_async_engine(self._DB_URL)
+
+    @property
+    def _Session(self) -> async_sessionmaker:
+        return async_sessionmaker(bind=self._engine)
+
+    @property
+    def _cache_scope(self) -> str:
+        return self._DB_URL.render_as_string(hide_password=False)
+
+    def invalidate_counts(self) -> None:
+        _count_cache.invalidate(self._cache_scope)
+
+    async def create_database(self):
+        async with self._engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+            await connection.run_sync(AuthBase.metadata.create_all)
+
+    async def delete_database(self):
+        async with self._engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+        self.invalidate_counts()
+
+    async def get_students(self) -> list[Student]:
+        async with self._Session() as session:
+            students = await session.scalars(Select(Student))
+            return students.all()
+
+    async def iter_students(self, page_size: int = 500, after_id: int | None = None,
+                            group: int | None = None) -> AsyncIterator[Student]:
+        while True:
+            last_id = None
+            async with self._Session() as session:
+                stmt = _students_page_stmt(page_size, after_id, group).execution_options(
+                    yield_per=page_size
+                )
+                async for student in await session.stream_scalars(stmt):
+                    last_id = student.id
+                    yield student
+            if last_id is None:
+                return
+            after_id = last_id
+
+    async def find_students(self, group: int | None = None, name_prefix: str | None = None,
+                            order_by: StudentOrder = StudentOrder.ID,
+                            limit: int | None = 50, offset: int = 0) -> list[Student]:
+        async with self._Session() as session:
+            stmt = _find_students_stmt(group, name_prefix, order_by, limit, offset)
+            students = await session.scalars(stmt)
+            return students.all()
+
+    async def get_students_table(self, page: int = 0, page_size: int = 50,
+                                 order_by: StudentOrder = StudentOrder.ID, descending: bool = False,
+                                 group: int | None = None, name_prefix: str | None = None,
+                                 after_id: int | None = None) -> pa.Table:
+        if page < 0:
+            raise ValueError('page must not be negative')
+        offset = page * page_size if after_id is None else 0
+        stmt = _find_students_stmt(group, name_prefix, order_by, page_size, offset,
+                                   descending, _STUDENT_COLUMNS, after_id)
+        async with self._engine.connect() as connection:
+            result = await connection.execute(stmt)
+            return _students_table(result.all())
+
+    async def get_students_page(self, page_size: int = 50, after_id: int | None = None,
+                                group: int | None = None) -> list[Student]:
+        async with self._Session() as session:
+            students = await session.scalars(_students_page_stmt(page_size, after_id, group))
+            return students.all()
+
+    async def create_student(self, first_name: str, last_name: str, group: int):
+        async with self._Session() as session:
+            session.add(Student(first_name=first_name, last_name=last_name, group=group))
+            await session.commit()
+        self.invalidate_counts()
+
+    async def create_students_bulk(self, students: Iterable[StudentRow], batch_size: int = 1000,
+                                   use_copy: bool | None = None) -> BulkInsertReport:
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        if use_copy is None:
+            use_copy = self._engine.dialect.driver == 'psycopg'
+        method = 'copy' if use_copy else 'insertmanyvalues'
+        insert_batch = self._copy_batch if use_copy else self._insert_batch
+        ids: list[int] = []
+        started = time.perf_counter()
+        try:
+            async with self._engine.begin() as connection:
+                for batch in _batched(students, batch_size):
+                    ids.extend(await insert_batch(connection, batch))
+        finally:
+            self.invalidate_counts()
+        return BulkInsertReport(ids, time.perf_counter() - started, method)
+
+    async def _insert_batch(self, connection: AsyncConnection, batch: list[StudentRow]) -> list[int]:
+        stmt = _bulk_insert_stmt(connection.dialect.name)
+        params = [
+            {'first_name': first_name, 'last_name': last_name, 'group': int(group)}
+            for first_name, last_name, group in batch
+        ]
+        ids = list(await connection.scalars(stmt, params))
+        return sorted(ids) if connection.dialect.name == 'sqlite' else ids
+
+    async def _copy_batch(self, connection: AsyncConnection, batch: list[StudentRow]) -> list[int]:
+        ids = list(await connection.scalars(
+            text("SELECT nextval(pg_get_serial_sequence('student', 'id')) "
+                 "FROM generate_series(1, :amount)"),
+            {'amount': len(batch)}
+        ))
+        raw_connection = await connection.get_raw_connection()
+        async with raw_connection.driver_connection.cursor() as cursor:
+            async with cursor.copy('COPY student (id, first_name, last_name, "group") FROM STDIN') as copy:
+                for student_id, (first_name, last_name, group) in zip(ids, batch):
+                    await copy.write_row((student_id, first_name, last_name, int(group)))
+        return ids
+
+    async def get_students_amount(self, mode: CountMode = CountMode.EXACT,
+                                  ttl: float | None = None) -> int:
+        if mode == CountMode.CACHED:
+            key = (self._cache_scope, 'total')
+            ttl = _count_cache_ttl() if ttl is None else ttl
+            amount = _count_cache.get(key, ttl)
+            if amount is None:
+                amount = await self._count_exact()
+                _count_cache.set(key, amount)
+            return amount
+        if mode == CountMode.ESTIMATED:
+            estimate = await self._count_estimated()
+            if estimate is not None:
+                return estimate
+        return await self._count_exact()
+
+    async def get_students_amount_by_group(self, cached: bool = False,
+                                           ttl: float | None = None) -> dict[int, int]:
+        key = (self._cache_scope, 'by_group')
+        if cached:
+            amounts = _count_cache.get(key, _count_cache_ttl() if ttl is None else ttl)
+            if amounts is not None:
+                return dict(amounts)
+        stmt = Select(Student.group, func.count()).group_by(Student.group).order_by(Student.group)
+        async with self._Session() as session:
+            result = await session.execute(stmt)
+            amounts = {group: amount for group, amount in result}
+        _count_cache.set(key, amounts)
+        return dict(amounts)
+
+    async def get_page_bundle(self, page_size: int = 50, after_id: int | None = None,
+                              group: int | None = None,
+                              mode: CountMode = CountMode.EXACT
+                              ) -> tuple[list[Student], int, dict[int, int]]:
+        # Every coroutine opens its own session, so the three queries run on
+        # separate pooled connections at the same time.
+        students, amount, amounts_by_group = await asyncio.gather(
+            self.get_students_page(page_size, after_id, group),
+            self.get_students_amount(mode),
+            self.get_students_amount_by_group(cached=mode == CountMode.CACHED)
+        )
+        return students, amount, amounts_by_group
+
+    async def _count_exact(self) -> int:
+        async with self._Session() as session:
+            return await session.scalar(Select(func.count()).select_from(Student))
+
+    async def _count_estimated(self) -> int | None:
+        if self._engine.dialect.name != 'postgresql':
+            return None
+        async with self._Session() as session:
+            estimate = await session.scalar(text(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass('student')"
+            ))
+        if estimate is None or estimate < 0:
+            return None
+        return int(estimate)
@@ -0,0 +1,66 @@
+from async_model import AsyncDBWorker
+from engine import dispose_loop_engines
+from model import CountMode, DBWorker
+import argparse
+import asyncio
+import statistics
+import time
+
+
+def bench_sync(db: DBWorker, repeat: int, page_size: int, mode: CountMode) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.get_students_page(page_size)
+        db.get_students_amount(mode)
+        db.get_students_amount_by_group(cached=mode == CountMode.CACHED)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def bench_async(db: AsyncDBWorker, repeat: int, page_size: int,
+                      mode: CountMode) -> list[float]:
+    # Each event loop gets its own engine and pool, so warm it up in this loop
+    await db.get_page_bundle(page_size, mode=mode)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await db.get_page_bundle(page_size, mode=mode)
+        timings.append(time.perf_counter() - started)
+    await dispose_loop_engines()
+    return timings
+
+
+def describe(name: str, timings: list[float]) -> str:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f'{name:>6}: mean {statistics.mean(timings) * 1000:8.2f} ms, '
+            f'p50 {statistics.median(timings) * 1000:8.2f} ms, p95 {p95 * 1000:8.2f} ms')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Latency of one page load (list + count + per-group stats), '
+                    'sync sequential vs async gather'
+    )
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--mode', choices=[mode.value for mode in CountMode],
+                        default=CountMode.EXACT.value)
+    args = parser.parse_args()
+    mode = CountMode(args.mode)
+
+    sync_db = DBWorker()
+    async_db = AsyncDBWorker()
+    # Warm up the pool so connection setup is not part of the measurement
+    bench_sync(sync_db, 1, args.page_size, mode)
+
+    sync_timings = bench_sync(sync_db, args.repeat, args.page_size, mode)
+    async_timings = asyncio.run(bench_async(async_db, args.repeat, args.page_size, mode))
+    print(describe('sync', sync_timings))
+    print(describe('async', async_timings))
+    print(f'speedup: {statistics.mean(sync_timings) / statistics.mean(async_timings):.2f}x')
+
+
+if __name__ == '__main__':
+    main()
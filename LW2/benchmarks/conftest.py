@@ -0,0 +1,55 @@
+import pytest
+
+from engine import dispose_engines
+from model import DBWorker
+from seed import generate_students
+
+
+def pytest_generate_tests(metafunc):
+    if 'rows' in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption('rows').split(',')]
+        metafunc.parametrize('rows', sizes, scope='session')
+    if 'records' in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption('records').split(',')]
+        metafunc.parametrize('records', sizes, scope='session')
+
+
+@pytest.fixture(scope='session')
+def db_url(request, tmp_path_factory) -> str:
+    url = request.config.getoption('db_url')
+    return url or f"sqlite:///{tmp_path_factory.mktemp('db') / 'bench.db'}"
+
+
+@pytest.fixture(scope='session')
+def seed(request) -> int:
+    return request.config.getoption('seed')
+
+
+@pytest.fixture(scope='session')
+def students(rows: int, seed: int) -> list[tuple[str, str, int]]:
+    return list(generate_students(rows, seed))
+
+
+@pytest.fixture(scope='session')
+def db(db_url: str):
+    worker = DBWorker(db_url)
+    yield worker
+    worker.delete_database()
+    dispose_engines()
+
+
+@pytest.fixture
+def empty_db(db: DBWorker) -> DBWorker:
+    db.delete_database()
+    db.create_database()
+    return db
+
+
+@pytest.fixture
+def seeded_db(db: DBWorker, students: list[tuple[str, str, int]]) -> DBWorker:
+    # Reseeding per test keeps the table at exactly `rows` even after the
+    # insert benchmarks ran against it
+    db.delete_database()
+    db.create_database()
+    db.create_students_bulk(students)
+    return db
@@ -0,0 +1,76 @@
+import itertools
+import random
+
+from model import CountMode, DBWorker, StudentOrder
+from seed import generate_students
+
+
+PAGE_SIZE = 50
+
+
+def test_insert_bulk(benchmark, empty_db: DBWorker, students, rows):
+    def setup():
+        empty_db.delete_database()
+        empty_db.create_database()
+
+    report = benchmark.pedantic(empty_db.create_students_bulk, args=(students,), setup=setup,
+                                rounds=3)
+    benchmark.extra_info.update(rows=rows, method=report.method)
+    assert report.rows == rows
+
+
+def test_insert_single(benchmark, empty_db: DBWorker, seed):
+    singles = itertools.cycle(generate_students(1000, seed + 1))
+    benchmark(lambda: empty_db.create_student(*next(singles)))
+
+
+def test_list_first_page(benchmark, seeded_db: DBWorker, rows):
+    table = benchmark(seeded_db.get_students_table, 0, PAGE_SIZE)
+    benchmark.extra_info['rows'] = rows
+    assert table.num_rows == min(rows, PAGE_SIZE)
+
+
+def test_list_random_page(benchmark, seeded_db: DBWorker, rows, seed):
+    rng = random.Random(seed)
+    pages = max(1, rows // PAGE_SIZE)
+    benchmark(lambda: seeded_db.get_students_table(rng.randrange(pages), PAGE_SIZE,
+                                                   StudentOrder.NAME))
+    benchmark.extra_info['rows'] = rows
+
+
+def test_list_keyset_page(benchmark, seeded_db: DBWorker, rows, seed):
+    rng = random.Random(seed)
+    benchmark(lambda: seeded_db.get_students_table(page_size=PAGE_SIZE,
+                                                   after_id=rng.randrange(rows)))
+    benchmark.extra_info['rows'] = rows
+
+
+def test_list_keyset_scan(benchmark, seeded_db: DBWorker, rows):
+    scanned = benchmark(lambda: sum(1 for _ in seeded_db.iter_students()))
+    benchmark.extra_info['rows'] = rows
+    assert scanned == rows
+
+
+def test_count_exact(benchmark, seeded_db: DBWorker, rows):
+    assert benchmark(seeded_db.get_students_amount, CountMode.EXACT) == rows
+
+
+def test_count_cached(benchmark, seeded_db: DBWorker, rows):
+    assert benchmark(seeded_db.get_students_amount, CountMode.CACHED) == rows
+
+
+def test_count_by_group(benchmark, seeded_db: DBWorker, rows):
+    counts = benchmark(seeded_db.get_students_amount_by_group)
+    assert sum(counts.values()) == rows
+
+
+def test_search_name_prefix(benchmark, seeded_db: DBWorker, students, seed):
+    rng = random.Random(seed)
+    prefixes = sorted({last_name[:2] for _, last_name, _ in students})
+    benchmark(lambda: seeded_db.find_students(name_prefix=rng.choice(prefixes)))
+
+
+def test_search_group(benchmark, seeded_db: DBWorker, students, seed):
+    rng = random.Random(seed)
+    groups = [group for _, _, group in students]
+    benchmark(lambda: seeded_db.find_students(group=rng.choice(groups)))
@@ -0,0 +1,62 @@
+import itertools
+import random
+import string
+
+import pytest
+
+from search import InvertedIndex
+
+
+VOCABULARY = 30_000
+
+
+@pytest.fixture(scope='session')
+def corpus(records: int, seed: int) -> tuple[InvertedIndex, list[str]]:
+    # Word frequencies follow Zipf's law, as in natural text, so the index has
+    # a few very common terms, a long tail of rare ones and real tf > 1
+    rng = random.Random(seed)
+    words = sorted({''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+                    for _ in range(VOCABULARY)})
+    rng.shuffle(words)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    index = InvertedIndex()
+    for number in range(records):
+        index.add(f'record-{number}', rng.choices(words, cum_weights=weights,
+                                                  k=rng.randint(4, 12)))
+    return index, words
+
+
+def _term_in(index: InvertedIndex, words: list[str], share: float) -> str:
+    return min((word for word in words if word in index._frequencies),
+               key=lambda word: abs(index._frequencies[word] / len(index) - share))
+
+
+@pytest.mark.parametrize('share', [0.1, 0.001])
+def test_search_term(benchmark, corpus, share):
+    index, words = corpus
+    term = _term_in(index, words, share)
+    assert len(benchmark(index.search, [term], 10)) == min(10, index._frequencies[term])
+    benchmark.extra_info.update(records=len(index), term=term)
+
+
+def test_search_two_terms(benchmark, corpus):
+    index, words = corpus
+    terms = [_term_in(index, words, 0.1), _term_in(index, words, 0.001)]
+    assert len(benchmark(index.search, terms, 10)) == 10
+    benchmark.extra_info.update(records=len(index), terms=terms)
+
+
+def test_search_two_common_terms(benchmark, corpus):
+    index, words = corpus
+    terms = [_term_in(index, words, 0.5), _term_in(index, words, 0.3)]
+    assert len(benchmark(index.search, terms, 10)) == 10
+    benchmark.extra_info.update(records=len(index), terms=terms)
+
+
+@pytest.mark.parametrize('length', [1, 2])
+def test_search_prefix(benchmark, corpus, length):
+    index, words = corpus
+    prefix = max({word[:length] for word in words},
+                 key=lambda prefix: sum(word.startswith(prefix) for word in words))
+    assert len(benchmark(index.search, [prefix], 10, True)) == 10
+    benchmark.extra_info.update(records=len(index), prefix=prefix)
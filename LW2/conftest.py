@@ -0,0 +1,10 @@
+def pytest_addoption(parser):
+    group = parser.getgroup('lw2 benchmarks')
+    group.addoption('--db-url', default=None,
+                    help='SQLAlchemy URL; a throwaway SQLite file by default. '
+                         'The schema is dropped and recreated, so never point it at real data.')
+    group.addoption('--rows', default='1000,10000',
+                    help='comma separated table sizes, e.g. 1000,10000,100000')
+    group.addoption('--records', default='100000',
+                    help='comma separated search index sizes, e.g. 100000,1000000')
+    group.addoption('--seed', type=int, default=0)
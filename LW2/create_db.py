@@ -2,4 +2,6 @@ from model import DBWorker
 
 
 db = DBWorker()
-db.create_database()
+index_usage = db.create_database()
+for index_name, used in index_usage.items():
+    print(f'{index_name}: {"used" if used else "NOT used"} by the planner')
@@ -0,0 +1,102 @@
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import TYPE_CHECKING
+import threading
+import json
+import os
+
+# model pulls in SQLAlchemy; the JSON backend and the login screen never need it
+if TYPE_CHECKING:
+    from model import DBWorker
+
+
+class CredentialStore(ABC):
+
+    @abstractmethod
+    def get_password(self, login: str) -> str | None:
+        ...
+
+    # Raises KeyError if the login is already taken
+    @abstractmethod
+    def add_user(self, login: str, password: str) -> None:
+        ...
+
+
+class JsonCredentialStore(CredentialStore):
+
+    def __init__(self, path: str = 'users.json') -> None:
+        self._path = path
+        self._users: Mapping[str, str] = MappingProxyType({})
+        self._signature: tuple[int, int, int] | None = None
+        self._lock = threading.Lock()
+
+    def _file_signature(self) -> tuple[int, int, int]:
+        stat = os.stat(self._path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _current_users(self) -> Mapping[str, str]:
+        signature = self._file_signature()
+        if signature == self._signature:
+            return self._users
+        with self._lock:
+            if signature != self._signature:
+                with open(self._path, encoding='utf-8') as file:
+                    users: dict[str, str] = json.load(file)
+                # Readers never take the lock: they see either the old or the
+                # new mapping, and the signature is published only afterwards.
+                self._users = MappingProxyType(users)
+                self._signature = signature
+            return self._users
+
+    def get_password(self, login: str) -> str | None:
+        return self._current_users().get(login)
+
+    def add_user(self, login: str, password: str) -> None:
+        with self._lock:
+            with open(self._path, encoding='utf-8') as file:
+                users: dict[str, str] = json.load(file)
+            if login in users:
+                raise KeyError(login)
+            users[login] = password
+            temp_path = f'{self._path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(users, file, ensure_ascii=False, indent=4)
+            os.replace(temp_path, self._path)
+
+
+class DBCredentialStore(CredentialStore):
+
+    def __init__(self, db: 'DBWorker | None' = None) -> None:
+        from model import DBWorker
+        self._db = db or DBWorker()
+
+    def get_password(self, login: str) -> str | None:
+        return self._db.get_user_password(login)
+
+    def add_user(self, login: str, password: str) -> None:
+        self._db.create_user(login, password)
+
+    def import_json(self, path: str = 'users.json', batch_size: int = 1000) -> int:
+        with open(path, encoding='utf-8') as file:
+            users: dict[str, str] = json.load(file)
+        return self._db.create_users_bulk(users.items(), batch_size=batch_size)
+
+
+_store: CredentialStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_credential_store() -> CredentialStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.getenv('CREDENTIALS_BACKEND', 'json')
+                if backend == 'json':
+                    _store = JsonCredentialStore(os.getenv('USERS_FILE', 'users.json'))
+                elif backend == 'db':
+                    _store = DBCredentialStore()
+                else:
+                    raise ValueError(f'Unknown credentials backend: {backend}')
+    return _store
@@ -0,0 +1,180 @@
+from sqlalchemy import URL, Engine, create_engine, make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from dataclasses import dataclass
+import threading
+import asyncio
+import time
+import os
+
+from instrumentation import QueryStats, instrument
+
+
+_engines: dict[str, Engine] = {}
+# Pooled async connections belong to the event loop that opened them, so
+# async engines are kept per loop
+_async_engines: dict[asyncio.AbstractEventLoop, dict[str, AsyncEngine]] = {}
+_query_stats: dict[Engine, QueryStats] = {}
+_engines_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return default if value in (None, '') else int(value)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return default if value in (None, '') else float(value)
+
+
+def pool_options() -> dict:
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+
+
+def _is_sqlite(url: URL | str) -> bool:
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+class TimedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+@dataclass
+class PoolStats:
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    wait_total: float
+    wait_max: float
+
+    @property
+    def wait_avg(self) -> float:
+        return self.wait_total / self.checkouts if self.checkouts else 0.0
+
+
+def _registry_key(url: URL | str) -> str:
+    if isinstance(url, URL):
+        return url.render_as_string(hide_password=False)
+    return url
+
+
+def get_engine(url: URL | str) -> Engine:
+    key = _registry_key(url)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            # SQLite picks its own pool (a single shared connection for :memory:)
+            # and rejects the QueuePool sizing arguments
+            options = {} if _is_sqlite(url) else {'poolclass': TimedQueuePool, **pool_options()}
+            engine = create_engine(url=url, **options)
+            _query_stats[engine] = instrument(
+                engine, QueryStats(slow_threshold_ms=_env_float('DB_SLOW_QUERY_MS', 200.0))
+            )
+            _engines[key] = engine
+        return engine
+
+
+def _drop_closed_loops() -> None:
+    # Engines of a finished loop (e.g. an earlier asyncio.run) can no longer
+    # use their connections; the pool is dropped without awaiting and the
+    # connections are closed when garbage collected
+    for loop in [loop for loop in _async_engines if loop.is_closed()]:
+        for engine in _async_engines.pop(loop).values():
+            engine.sync_engine.dispose(close=False)
+
+
+def get_async_engine(url: URL | str) -> AsyncEngine:
+    # Must be called from inside the loop that will use the engine
+    loop = asyncio.get_running_loop()
+    key = _registry_key(url)
+    engine = _async_engines.get(loop, {}).get(key)
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        _drop_closed_loops()
+        engines = _async_engines.setdefault(loop, {})
+        engine = engines.get(key)
+        if engine is None:
+            engine = create_async_engine(url, **({} if _is_sqlite(url) else pool_options()))
+            engines[key] = engine
+        return engine
+
+
+async def dispose_loop_engines() -> None:
+    # Closes the running loop's pooled connections properly; call it as the
+    # last step of a coroutine passed to asyncio.run
+    loop = asyncio.get_running_loop()
+    with _engines_lock:
+        engines = _async_engines.pop(loop, {})
+    for engine in engines.values():
+        await engine.dispose()
+
+
+def dispose_engines() -> None:
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _query_stats.clear()
+        # Async pools are dropped without awaiting; their connections are
+        # closed when garbage collected.
+        for engines in _async_engines.values():
+            for engine in engines.values():
+                engine.sync_engine.dispose(close=False)
+        _async_engines.clear()
+
+
+def query_stats(engine: Engine) -> QueryStats | None:
+    return _query_stats.get(engine)
+
+
+def pool_stats(engine: Engine) -> PoolStats:
+    pool = engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return PoolStats(0, 0, 0, 0, 0, 0.0, 0.0)
+    with pool._wait_lock:
+        return PoolStats(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            checkouts=pool.checkouts,
+            wait_total=pool.wait_total,
+            wait_max=pool.wait_max
+        )
@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+from dataclasses import asdict, dataclass
+import subprocess
+import argparse
+import platform
+import json
+import sys
+import os
+import re
+
+
+# Lines look like "import time:       512 |       1834 |   streamlit.runtime"
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure_imports(module: str, path: str = '.') -> list[ImportRecord]:
+    # A fresh interpreter each time, so nothing is already in sys.modules
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=path, capture_output=True, text=True
+    )
+    records = []
+    for line in process.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append(ImportRecord(name, int(self_us), int(cumulative_us), len(indent) // 2))
+    if process.returncode != 0 and not records:
+        raise RuntimeError(f'importing {module} failed:\n{process.stderr}')
+    return records
+
+
+def summarize(records: list[ImportRecord], top: int) -> dict:
+    # Top-level imports carry the cumulative cost of everything below them
+    roots = [record for record in records if record.depth == 0]
+    packages: dict[str, int] = {}
+    for record in records:
+        package = record.module.split('.')[0]
+        packages[package] = packages.get(package, 0) + record.self_us
+    return {
+        'total_ms': sum(record.cumulative_us for record in roots) / 1000,
+        'modules': len(records),
+        'top_imports': [asdict(record) for record in
+                        sorted(roots, key=lambda record: record.cumulative_us, reverse=True)[:top]],
+        'top_packages': dict(sorted(packages.items(), key=lambda item: item[1],
+                                    reverse=True)[:top]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Cold-start import time of an app module, parsed from -X importtime. '
+                    'For LW5 run it as: importtime.py --path ../LW5 --module app'
+    )
+    parser.add_argument('--module', default='program')
+    parser.add_argument('--path', default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--history', default=None,
+                        help='JSON lines file the summary is appended to')
+    args = parser.parse_args()
+
+    runs = [summarize(measure_imports(args.module, args.path), args.top) for _ in range(args.runs)]
+    # The fastest run is the least disturbed by the rest of the machine
+    best = min(runs, key=lambda run: run['total_ms'])
+    print(f"{args.module}: {best['total_ms']:.1f} ms over {best['modules']} modules "
+          f"(best of {args.runs}, median "
+          f"{sorted(run['total_ms'] for run in runs)[len(runs) // 2]:.1f} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for record in best['top_imports']:
+        print(f"{record['cumulative_us'] / 1000:>14.1f} {record['self_us'] / 1000:>9.1f}  "
+              f"{record['module']}")
+    print(f"\n{'self ms':>14}  package")
+    for package, self_us in best['top_packages'].items():
+        print(f'{self_us / 1000:>14.1f}  {package}')
+
+    if args.history:
+        entry = {
+            'datetime': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'module': args.module,
+            'runs': [run['total_ms'] for run in runs],
+            **best,
+        }
+        with open(args.history, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+from sqlalchemy import Engine, event
+from collections import deque
+from dataclasses import dataclass, field
+import threading
+import logging
+import bisect
+import time
+import re
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_statement(statement: str, limit: int = 200) -> str:
+    return _WHITESPACE_RE.sub(' ', statement).strip()[:limit]
+
+
+@dataclass
+class StatementStats:
+    statement: str
+    calls: int = 0
+    rows: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * len(BUCKETS_MS))
+
+    def record(self, duration_ms: float, rowcount: int) -> None:
+        self.calls += 1
+        self.rows += max(rowcount, 0)
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def percentile_ms(self, fraction: float) -> float:
+        # Upper bound of the bucket holding the requested rank
+        rank = fraction * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+@dataclass
+class SlowQuery:
+    timestamp: float
+    duration_ms: float
+    statement: str
+    rowcount: int
+
+
+class QueryStats:
+
+    def __init__(self, slow_threshold_ms: float = 200.0, slow_log_size: int = 100) -> None:
+        self.slow_threshold_ms = slow_threshold_ms
+        self._lock = threading.Lock()
+        self._statements: dict[str, StatementStats] = {}
+        self._slow: deque[SlowQuery] = deque(maxlen=slow_log_size)
+        self.connections = 0
+        self.checkouts = 0
+
+    def record(self, statement: str, duration_ms: float, rowcount: int) -> None:
+        key = normalize_statement(statement)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats(key)
+            stats.record(duration_ms, rowcount)
+            if duration_ms >= self.slow_threshold_ms:
+                self._slow.append(SlowQuery(time.time(), duration_ms, key, rowcount))
+        if duration_ms >= self.slow_threshold_ms:
+            logger.warning('Slow query (%.1f ms, %d rows): %s', duration_ms, rowcount, key)
+
+    # Pool events fire on whichever thread checks a connection out
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def record_checkout(self) -> None:
+        with self._lock:
+            self.checkouts += 1
+
+    def statements(self) -> list[StatementStats]:
+        with self._lock:
+            return sorted(self._statements.values(), key=lambda stats: stats.total_ms,
+                          reverse=True)
+
+    def slow_queries(self) -> list[SlowQuery]:
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+
+
+def instrument(engine: Engine, stats: QueryStats) -> QueryStats:
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_start'].pop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        rowcount = getattr(cursor, 'rowcount', -1)
+        stats.record(statement, duration_ms, rowcount if rowcount is not None else -1)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # Keep the timing stack balanced when a statement fails
+        if context.connection is not None:
+            starts = context.connection.info.get('query_start')
+            if starts:
+                starts.pop()
+
+    @event.listens_for(engine.pool, 'connect')
+    def connect(dbapi_connection, connection_record):
+        stats.record_connect()
+
+    @event.listens_for(engine.pool, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.record_checkout()
+
+    return stats
@@ -4,19 +4,43 @@ from sqlalchemy.orm import (
     declarative_base,
     sessionmaker
 )
-from sqlalchemy import URL, create_engine
-from sqlalchemy import Select
+from sqlalchemy import URL, Engine, make_url
+from sqlalchemy import Index, Insert, Select, insert, text
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from enum import StrEnum
+from itertools import islice
+import pyarrow as pa
+import threading
+import logging
+import time
 import os
 
+from engine import PoolStats, get_engine, pool_stats, query_stats
+from instrumentation import QueryStats
+
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
+# Accounts live on their own metadata so dropping the student schema
+# (delete_database, the benchmarks, seed.py --recreate) never touches them
+AuthBase = declarative_base()
 
 
 
 class Student(Base):
 
     __tablename__ = 'student'
+    __table_args__ = (
+        Index('ix_student_group', 'group'),
+        Index('ix_student_last_first', 'last_name', 'first_name'),
+        # text_pattern_ops lets LIKE 'prefix%' use the index under non-C collations
+        Index('ix_student_last_name_pattern', 'last_name',
+              postgresql_ops={'last_name': 'text_pattern_ops'}),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     first_name: Mapped[str] = mapped_column(nullable=False)
@@ -25,28 +49,244 @@ class Student(Base):
 
     def __repr__(self) -> str:
         return f'Student(id={self.id}; first_name={self.first_name}; last_name={self.last_name}; group={self.group})'
-    
 
-class DBWorker:
+
+class User(AuthBase):
+
+    __tablename__ = 'app_user'
+
+    login: Mapped[str] = mapped_column(primary_key=True)
+    password: Mapped[str] = mapped_column(nullable=False)
+
+    def __repr__(self) -> str:
+        return f'User(login={self.login})'
+
+
+StudentRow = tuple[str, str, int]
+
+
+class StudentOrder(StrEnum):
+    ID = 'id'
+    NAME = 'name'
+    GROUP = 'group'
+
+
+class CountMode(StrEnum):
+    EXACT = 'exact'
+    ESTIMATED = 'estimated'
+    CACHED = 'cached'
+
+
+class _CountCache:
 
     def __init__(self) -> None:
-        self._DB_URL = URL.create(
-            drivername='postgresql+psycopg',
-            username=os.getenv('DB_OWNER_NAME'),
-            password=os.getenv('DB_PASSWORD'),
-            host=os.getenv('DB_HOST_NAME'),
-            port=os.getenv('DB_PORT'),
-            database=os.getenv('DB_NAME')
-        )
-        self._engine = create_engine(url=self._DB_URL)
-        self._Session = sessionmaker(bind=self._engine)
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, str], tuple[float, object]] = {}
+
+    def get(self, key: tuple[str, str], ttl: float):
+        with self._lock:
+            entry = self._values.get(key)
+        if entry is None or time.monotonic() - entry[0] > ttl:
+            return None
+        return entry[1]
+
+    def set(self, key: tuple[str, str], value) -> None:
+        with self._lock:
+            self._values[key] = (time.monotonic(), value)
+
+    def invalidate(self, scope: str) -> None:
+        with self._lock:
+            for key in [key for key in self._values if key[0] == scope]:
+                del self._values[key]
+
+
+_count_cache = _CountCache()
+
+
+@dataclass
+class BulkInsertReport:
+    ids: list[int]
+    elapsed: float
+    method: str
+
+    @property
+    def rows(self) -> int:
+        return len(self.ids)
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.elapsed <= 0:
+            return float(self.rows)
+        return self.rows / self.elapsed
+
+
+def default_db_url() -> URL:
+    # DB_URL takes any SQLAlchemy URL, e.g. sqlite:///students.db for local runs
+    if url := os.getenv('DB_URL'):
+        return make_url(url)
+    return URL.create(
+        drivername='postgresql+psycopg',
+        username=os.getenv('DB_OWNER_NAME'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST_NAME'),
+        port=os.getenv('DB_PORT'),
+        database=os.getenv('DB_NAME')
+    )
+
+
+def _count_cache_ttl() -> float:
+    return float(os.getenv('DB_COUNT_CACHE_TTL', '30'))
+
+
+def _students_page_stmt(page_size: int, after_id: int | None = None,
+                        group: int | None = None) -> Select:
+    if page_size < 1:
+        raise ValueError('page_size must be positive')
+    stmt = Select(Student)
+    if after_id is not None:
+        stmt = stmt.where(Student.id > after_id)
+    if group is not None:
+        stmt = stmt.where(Student.group == group)
+    return stmt.order_by(Student.id).limit(page_size)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def _find_students_stmt(group: int | None = None, name_prefix: str | None = None,
+                        order_by: StudentOrder = StudentOrder.ID,
+                        limit: int | None = 50, offset: int = 0,
+                        descending: bool = False, columns: tuple | None = None,
+                        after_id: int | None = None) -> Select:
+    stmt = Select(*columns) if columns else Select(Student)
+    if after_id is not None:
+        # Keyset paging needs a unique sort key, which only the ID order has
+        if StudentOrder(order_by) != StudentOrder.ID:
+            raise ValueError('after_id is only supported for StudentOrder.ID')
+        stmt = stmt.where(Student.id < after_id if descending else Student.id > after_id)
+    if group is not None:
+        stmt = stmt.where(Student.group == group)
+    if name_prefix:
+        stmt = stmt.where(Student.last_name.like(_escape_like(name_prefix) + '%', escape='/'))
+    match StudentOrder(order_by):
+        case StudentOrder.NAME:
+            ordering = (Student.last_name, Student.first_name, Student.id)
+        case StudentOrder.GROUP:
+            ordering = (Student.group, Student.id)
+        case StudentOrder.ID:
+            ordering = (Student.id,)
+    # Every ordering column flips together, so the same indexes serve both directions
+    stmt = stmt.order_by(*(column.desc() if descending else column for column in ordering))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    if offset:
+        stmt = stmt.offset(offset)
+    return stmt
+
+
+def _bulk_insert_stmt(dialect_name: str) -> Insert:
+    # SQLite does not promise RETURNING order, so sort_by_parameter_order makes
+    # SQLAlchemy fall back to one INSERT per row there. Its rowids are handed
+    # out in ascending order inside one write transaction, so the caller sorts
+    # the returned ids instead
+    if dialect_name == 'sqlite':
+        return insert(Student).returning(Student.id)
+    return insert(Student).returning(Student.id, sort_by_parameter_order=True)
+
 
+_STUDENT_COLUMNS = (Student.id, Student.last_name, Student.first_name, Student.group)
 
-    def create_database(self):            
-        Base.metadata.create_all(self._engine)        
+STUDENT_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('last_name', pa.string()),
+    ('first_name', pa.string()),
+    ('group', pa.int64()),
+])
+
+
+def _students_table(rows: list[tuple]) -> pa.Table:
+    columns = list(zip(*rows)) if rows else [()] * len(STUDENT_SCHEMA)
+    return pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, STUDENT_SCHEMA)],
+        schema=STUDENT_SCHEMA
+    )
+
+
+_INDEX_PROBES = {
+    'ix_student_group': lambda: _find_students_stmt(group=0),
+    'ix_student_last_first': lambda: _find_students_stmt(order_by=StudentOrder.NAME, limit=10),
+    'ix_student_last_name_pattern': lambda: _find_students_stmt(name_prefix='a'),
+}
+
+
+def _batched(rows: Iterable[StudentRow], batch_size: int) -> Iterator[list[StudentRow]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+class DBWorker:
+
+    def __init__(self, url: URL | str | None = None) -> None:
+        self._DB_URL = make_url(url) if url is not None else default_db_url()
+        self._engine_instance: Engine | None = None
+        self._session_factory: sessionmaker | None = None
+
+    # The engine, and with it the DBAPI driver import, is only created by the
+    # first query, so building a worker costs nothing
+    @property
+    def _engine(self) -> Engine:
+        if self._engine_instance is None:
+            self._engine_instance = get_engine(self._DB_URL)
+        return self._engine_instance
+
+    @property
+    def _Session(self) -> sessionmaker:
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(bind=self._engine)
+        return self._session_factory
+
+    def pool_stats(self) -> PoolStats:
+        return pool_stats(self._engine)
+
+    def query_stats(self) -> QueryStats | None:
+        return query_stats(self._engine)
+
+    @property
+    def _cache_scope(self) -> str:
+        return self._DB_URL.render_as_string(hide_password=False)
+
+    def invalidate_counts(self) -> None:
+        _count_cache.invalidate(self._cache_scope)
+
+
+    def create_database(self) -> dict[str, bool]:
+        Base.metadata.create_all(self._engine)
+        AuthBase.metadata.create_all(self._engine)
+        # create_all skips indexes of tables that already exist
+        for index in Student.__table__.indexes:
+            index.create(self._engine, checkfirst=True)
+        return self.check_indexes()
+
+    def check_indexes(self) -> dict[str, bool]:
+        if self._engine.dialect.name != 'postgresql':
+            return {}
+        usage = {}
+        with self._engine.connect() as connection:
+            # On a small table the planner rightly prefers a seq scan, so it is
+            # disabled here to check that each index is usable at all.
+            connection.execute(text('SET LOCAL enable_seqscan = off'))
+            for name, probe in _INDEX_PROBES.items():
+                compiled = probe().compile(dialect=self._engine.dialect)
+                plan = connection.exec_driver_sql(f'EXPLAIN {compiled}', compiled.params).scalars().all()
+                usage[name] = any(name in line for line in plan)
+            connection.rollback()
+        return usage
 
     def delete_database(self):            
         Base.metadata.drop_all(self._engine)
+        self.invalidate_counts()
     
     def get_students(self):
         with self._Session() as session:
@@ -54,13 +294,162 @@ class DBWorker:
             students = session.scalars(stmt)
             return students.all()
 
+    def iter_students(self, page_size: int = 500, after_id: int | None = None,
+                      group: int | None = None) -> Iterator[Student]:
+        while True:
+            last_id = None
+            with self._Session() as session:
+                stmt = _students_page_stmt(page_size, after_id, group).execution_options(
+                    stream_results=True, yield_per=page_size
+                )
+                for student in session.scalars(stmt):
+                    last_id = student.id
+                    yield student
+            if last_id is None:
+                return
+            after_id = last_id
+
+    def find_students(self, group: int | None = None, name_prefix: str | None = None,
+                      order_by: StudentOrder = StudentOrder.ID,
+                      limit: int | None = 50, offset: int = 0) -> list[Student]:
+        with self._Session() as session:
+            stmt = _find_students_stmt(group, name_prefix, order_by, limit, offset)
+            return session.scalars(stmt).all()
+
+    def get_students_table(self, page: int = 0, page_size: int = 50,
+                           order_by: StudentOrder = StudentOrder.ID, descending: bool = False,
+                           group: int | None = None, name_prefix: str | None = None,
+                           after_id: int | None = None) -> pa.Table:
+        if page < 0:
+            raise ValueError('page must not be negative')
+        # With after_id the window starts right after that row, page is ignored
+        offset = page * page_size if after_id is None else 0
+        stmt = _find_students_stmt(group, name_prefix, order_by, page_size, offset,
+                                   descending, _STUDENT_COLUMNS, after_id)
+        # Plain Core rows, no ORM identity map for a read-only window
+        with self._engine.connect() as connection:
+            return _students_table(connection.execute(stmt).all())
+
+    def get_students_page(self, page_size: int = 50, after_id: int | None = None,
+                          group: int | None = None) -> list[Student]:
+        with self._Session() as session:
+            return session.scalars(_students_page_stmt(page_size, after_id, group)).all()
+
     def create_student(self, first_name: str, last_name: str, group: int):
-        print('Called!')
+        logger.debug('Creating student %s %s (group %s)', last_name, first_name, group)
         with self._Session() as session:
             new_student = Student(first_name=first_name, last_name=last_name, group=group)
             session.add(new_student)
             session.commit()
+        self.invalidate_counts()
+
+    def create_students_bulk(self, students: Iterable[StudentRow], batch_size: int = 1000,
+                             use_copy: bool | None = None) -> BulkInsertReport:
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        if use_copy is None:
+            use_copy = self._engine.dialect.driver == 'psycopg'
+        method = 'copy' if use_copy else 'insertmanyvalues'
+        insert_batch = self._copy_batch if use_copy else self._insert_batch
+        ids: list[int] = []
+        started = time.perf_counter()
+        try:
+            with self._engine.begin() as connection:
+                for batch in _batched(students, batch_size):
+                    ids.extend(insert_batch(connection, batch))
+        finally:
+            self.invalidate_counts()
+        return BulkInsertReport(ids, time.perf_counter() - started, method)
+
+    def _insert_batch(self, connection, batch: list[StudentRow]) -> list[int]:
+        stmt = _bulk_insert_stmt(connection.dialect.name)
+        params = [
+            {'first_name': first_name, 'last_name': last_name, 'group': int(group)}
+            for first_name, last_name, group in batch
+        ]
+        ids = list(connection.scalars(stmt, params))
+        return sorted(ids) if connection.dialect.name == 'sqlite' else ids
+
+    def _copy_batch(self, connection, batch: list[StudentRow]) -> list[int]:
+        # COPY cannot return generated keys, so the ids are reserved from the
+        # sequence up front and written explicitly alongside the rows.
+        ids = list(connection.scalars(
+            text("SELECT nextval(pg_get_serial_sequence('student', 'id')) "
+                 "FROM generate_series(1, :amount)"),
+            {'amount': len(batch)}
+        ))
+        cursor = connection.connection.cursor()
+        try:
+            with cursor.copy('COPY student (id, first_name, last_name, "group") FROM STDIN') as copy:
+                for student_id, (first_name, last_name, group) in zip(ids, batch):
+                    copy.write_row((student_id, first_name, last_name, int(group)))
+        finally:
+            cursor.close()
+        return ids
+
+    def get_user_password(self, login: str) -> str | None:
+        with self._Session() as session:
+            return session.scalar(Select(User.password).where(User.login == login))
+
+    def create_user(self, login: str, password: str) -> None:
+        with self._Session() as session:
+            session.add(User(login=login, password=password))
+            try:
+                session.commit()
+            except IntegrityError:
+                raise KeyError(login) from None
+
+    def create_users_bulk(self, users: Iterable[tuple[str, str]], batch_size: int = 1000) -> int:
+        created = 0
+        with self._engine.begin() as connection:
+            for batch in _batched(users, batch_size):
+                connection.execute(insert(User), [
+                    {'login': login, 'password': password} for login, password in batch
+                ])
+                created += len(batch)
+        return created
+
+    def get_students_amount(self, mode: CountMode = CountMode.EXACT,
+                            ttl: float | None = None) -> int:
+        if mode == CountMode.CACHED:
+            key = (self._cache_scope, 'total')
+            ttl = _count_cache_ttl() if ttl is None else ttl
+            amount = _count_cache.get(key, ttl)
+            if amount is None:
+                amount = self._count_exact()
+                _count_cache.set(key, amount)
+            return amount
+        if mode == CountMode.ESTIMATED:
+            estimate = self._count_estimated()
+            if estimate is not None:
+                return estimate
+        return self._count_exact()
+
+    def get_students_amount_by_group(self, cached: bool = False,
+                                     ttl: float | None = None) -> dict[int, int]:
+        key = (self._cache_scope, 'by_group')
+        if cached:
+            amounts = _count_cache.get(key, _count_cache_ttl() if ttl is None else ttl)
+            if amounts is not None:
+                return dict(amounts)
+        stmt = Select(Student.group, func.count()).group_by(Student.group).order_by(Student.group)
+        with self._Session() as session:
+            amounts = {group: amount for group, amount in session.execute(stmt)}
+        _count_cache.set(key, amounts)
+        return dict(amounts)
+
+    def _count_exact(self) -> int:
+        with self._Session() as session:
+            return session.scalar(Select(func.count()).select_from(Student))
 
-    def get_students_amount(self) -> int:
+    def _count_estimated(self) -> int | None:
+        if self._engine.dialect.name != 'postgresql':
+            return None
         with self._Session() as session:
-            return session.query(Student).count()
\ No newline at end of file
+            estimate = session.scalar(text(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass('student')"
+            ))
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if estimate is None or estimate < 0:
+            return None
+        return int(estimate)
@@ -1,10 +1,29 @@
-from model import DBWorker
-from typing import Literal
+import time
+
+# Taken before the other imports so the first-render timing includes them
+_script_started = time.perf_counter()
+
+from credentials import get_credential_store
+from storage import LogStore, get_log_store
+from search import RecordSearch, confidential_digest, get_search
+from typing import TYPE_CHECKING, Literal
+from collections.abc import Iterable
+from functools import cached_property
 import streamlit as st
 from enum import StrEnum
+import logging
+import math
+import csv
+import io
 import os
-import json
-from streamlit_extras.stateful_button import button
+
+# model brings in SQLAlchemy, pyarrow and the DB driver. It is imported on
+# first use so the login screen does not wait for it.
+if TYPE_CHECKING:
+    from model import DBWorker
+
+
+logger = logging.getLogger(__name__)
 
 
 class AppStates(StrEnum):
@@ -22,10 +41,24 @@ class AuthenticationStatus(StrEnum):
     OTHER = 'other'
 
 
+def _parse_students_csv(text: str) -> list[tuple[str, str, int]]:
+    students = []
+    for line, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row:
+            continue
+        if len(row) != 3:
+            raise ValueError(f'строка {line}: ожидалось 3 поля, получено {len(row)}')
+        first_name, last_name, group = (field.strip() for field in row)
+        try:
+            students.append((first_name, last_name, int(group)))
+        except ValueError:
+            raise ValueError(f'строка {line}: номер группы должен быть числом') from None
+    return students
+
+
 class App:
 
     def __init__(self) -> None:
-        self._db = DBWorker()
         if not 'authenticated_person' in st.session_state:
             st.session_state['authenticated_person'] = None
         if not 'user_type' in st.session_state:
@@ -38,8 +71,37 @@ class App:
             st.session_state['render_stop'] = False        
         self._container = st.session_state['placeholder']
     
+    @cached_property
+    def _db(self) -> 'DBWorker':
+        from model import DBWorker
+        return DBWorker()
+
+    # Stores replay their logs and build search indexes when first opened;
+    # only the authenticated layout needs them
+    @cached_property
+    def _conf_store(self) -> LogStore:
+        return get_log_store('conf')
+
+    @cached_property
+    def _nonconf_store(self) -> LogStore:
+        return get_log_store('nonconf')
+
+    @cached_property
+    def _conf_search(self) -> RecordSearch:
+        return get_search('conf')
+
+    @cached_property
+    def _nonconf_search(self) -> RecordSearch:
+        return get_search('nonconf')
+
     def run(self) -> None:
         self._render_main_layout()
+        elapsed = time.perf_counter() - _script_started
+        if not st.session_state.get('first_render_logged'):
+            st.session_state['first_render_logged'] = True
+            logger.info('First render of the session took %.1f ms', elapsed * 1000)
+        else:
+            logger.debug('Rerun took %.1f ms', elapsed * 1000)
     
     def _app_state(self, state: AppStates):
         st.session_state['state'] = state
@@ -127,11 +189,13 @@ class App:
                 type='password')
                 signup_col, back_col = st.columns([2, 1])
                 with signup_col:
-                    st.form_submit_button('Добавить нового пользователя', use_container_width=True)
+                    signup_btn = st.form_submit_button('Добавить нового пользователя',
+                                                       use_container_width=True)
                 with back_col:
                     st.form_submit_button('Назад', on_click=self._reset_app,
                     use_container_width=True)
-                # st.error('Пароли не совпадают!')
+                if signup_btn:
+                    self._signup_user(login, password, repeat_password)
 
     def _render_authentication_layout(self, user_type: Literal['admin', 'user', 'guest']) -> None:        
         self._container.empty()                                
@@ -167,55 +231,188 @@ class App:
         self._container.empty()       
         with self._container.container():
             st.header('Выберите возможную функцию')
-            tab1, tab2 = st.tabs(["Конфиденциальные данные", "Неконфиденциальные данные"])
+            tab_names = ["Конфиденциальные данные", "Неконфиденциальные данные", "Студенты"]
+            if user_type == 'admin':
+                tab_names.append("Мониторинг БД")
+            tab1, tab2, tab3, *admin_tabs = st.tabs(tab_names)
 
-            # Функционал для конфиденциальных данных
+            # Каждая вкладка — отдельный фрагмент: действия внутри неё
+            # перерисовывают только её, а не всё приложение
             with tab1:
-                st.subheader("Конфиденциальные данные")
+                self._render_conf_tab()
+            with tab2:
+                self._render_nonconf_tab()
+            with tab3:
+                self._render_students_tab()
 
-                action = st.selectbox("Выберите действие", ["Создать", "Редактировать", "Удалить", "Поиск"])
+            # Статистика запросов к базе данных, только для администратора
+            for tab in admin_tabs:
+                with tab:
+                    self._render_db_monitoring()
+            log_out_btn = st.button('Выйти из аккаунта', key='log_out_btn', on_click=self._reset_app)
 
-                if action == "Создать":
-                    st.text_input("Введите данные для создания")
-                    st.text_area("Значение этих данных")
-                    st.button("Создать")
-                    
-                elif action == "Редактировать":
-                    st.text_input("Введите идентификатор данных для редактирования")
-                    st.text_area("Отредактируйте данные")
-                    st.button("Сохранить изменения")
+    @st.fragment
+    def _render_conf_tab(self) -> None:
+        st.subheader("Конфиденциальные данные")
 
-                elif action == "Удалить":
-                    st.text_input("Введите идентификатор данных для удаления")
-                    st.button("Удалить")                    
+        action = st.selectbox("Выберите действие", ["Создать", "Редактировать", "Удалить", "Поиск"])
 
-                elif action == "Поиск":
-                    st.text_input("Введите ключевое слово для поиска")
-                    st.button("Найти")                    
+        if action == "Создать":
+            key = st.text_input("Введите данные для создания")
+            value = st.text_area("Значение этих данных")
+            if st.button("Создать"):
+                if self._create_record(self._conf_store, key, confidential_digest(value)):
+                    self._conf_search.index(key, value)
+            
+        elif action == "Редактировать":
+            key = st.text_input("Введите идентификатор данных для редактирования")
+            value = st.text_area("Отредактируйте данные")
+            if st.button("Сохранить изменения"):
+                if self._update_record(self._conf_store, key, confidential_digest(value)):
+                    self._conf_search.index(key, value)
 
-            # Функционал для неконфиденциальных данных
-            with tab2:
-                st.subheader("Неконфиденциальные данные")
-
-                action = st.selectbox("Выберите действие", ["Создать", "Редактировать", "Удалить", "Поиск"], key="non_conf")
-
-                if action == "Создать":
-                    st.text_input("Введите данные для создания", key="create_non_conf")
-                    st.button("Создать", key="create_btn_non_conf")
-                    
-                elif action == "Редактировать":
-                    st.text_input("Введите идентификатор данных для редактирования", key="edit_non_conf")
-                    st.text_area("Отредактируйте данные", key="edit_area_non_conf")
-                    st.button("Сохранить изменения", key="save_btn_non_conf")
-
-                elif action == "Удалить":
-                    st.text_input("Введите идентификатор данных для удаления", key="delete_non_conf")
-                    st.button("Удалить", key="delete_btn_non_conf")
-
-                elif action == "Поиск":
-                    st.text_input("Введите ключевое слово для поиска", key="search_non_conf")
-                    st.button("Найти", key="search_btn_non_conf")            
-            log_out_btn = st.button('Выйти из аккаунта', key='log_out_btn', on_click=self._reset_app)
+        elif action == "Удалить":
+            key = st.text_input("Введите идентификатор данных для удаления")
+            if st.button("Удалить"):
+                if self._delete_record(self._conf_store, key):
+                    self._conf_search.unindex(key)
+
+        elif action == "Поиск":
+            query = st.text_input("Введите ключевое слово для поиска")
+            prefix = st.checkbox("Искать по началу слова", value=True)
+            if st.button("Найти"):
+                self._search_records(self._conf_search, self._conf_store, query, prefix,
+                                     show_values=False)
+
+    @st.fragment
+    def _render_nonconf_tab(self) -> None:
+        st.subheader("Неконфиденциальные данные")
+
+        action = st.selectbox("Выберите действие", ["Создать", "Редактировать", "Удалить", "Поиск"], key="non_conf")
+
+        if action == "Создать":
+            value = st.text_input("Введите данные для создания", key="create_non_conf")
+            if st.button("Создать", key="create_btn_non_conf"):
+                key = self._nonconf_store.next_key('non_conf_')
+                self._create_record(self._nonconf_store, key, value)
+            
+        elif action == "Редактировать":
+            key = st.text_input("Введите идентификатор данных для редактирования", key="edit_non_conf")
+            value = st.text_area("Отредактируйте данные", key="edit_area_non_conf")
+            if st.button("Сохранить изменения", key="save_btn_non_conf"):
+                self._update_record(self._nonconf_store, key, value)
+
+        elif action == "Удалить":
+            key = st.text_input("Введите идентификатор данных для удаления", key="delete_non_conf")
+            if st.button("Удалить", key="delete_btn_non_conf"):
+                self._delete_record(self._nonconf_store, key)
+
+        elif action == "Поиск":
+            query = st.text_input("Введите ключевое слово для поиска", key="search_non_conf")
+            prefix = st.checkbox("Искать по началу слова", value=True, key="prefix_non_conf")
+            if st.button("Найти", key="search_btn_non_conf"):
+                self._search_records(self._nonconf_search, self._nonconf_store, query, prefix)
+
+    @st.fragment
+    def _render_students_tab(self) -> None:
+        st.subheader("Студенты")
+
+        action = st.selectbox("Выберите действие", ["Список", "Добавить", "Загрузить CSV"],
+                              key="students_action")
+
+        if action == "Список":
+            if st.button("Посчитать учащихся", key="students_amount_btn"):
+                self._get_students_amount()
+            self._get_students()
+
+        elif action == "Добавить":
+            with st.form('create_student_form', clear_on_submit=True):
+                first_name = st.text_input("Имя")
+                last_name = st.text_input("Фамилия")
+                group = st.text_input("Номер группы")
+                if st.form_submit_button("Добавить"):
+                    self._create_student(first_name, last_name, group)
+
+        elif action == "Загрузить CSV":
+            st.caption('Строки вида: имя,фамилия,номер группы')
+            file = st.file_uploader("CSV-файл", type=['csv'], key="students_csv")
+            if file is not None and st.button("Загрузить", key="students_csv_btn"):
+                try:
+                    students = _parse_students_csv(file.getvalue().decode('utf-8-sig'))
+                except (UnicodeDecodeError, ValueError) as e:
+                    st.error(f'Ошибка в файле: {e}')
+                else:
+                    self._create_students_bulk(students)
+
+    @st.fragment
+    def _render_db_monitoring(self) -> None:
+        from instrumentation import BUCKETS_MS
+        st.subheader("Мониторинг БД")
+        stats = self._db.query_stats()
+        pool = self._db.pool_stats()
+
+        size_col, out_col, wait_col, max_col = st.columns(4)
+        size_col.metric('Размер пула', pool.size)
+        out_col.metric('Занято соединений', pool.checked_out)
+        wait_col.metric('Среднее ожидание, мс', f'{pool.wait_avg * 1000:.2f}')
+        max_col.metric('Макс. ожидание, мс', f'{pool.wait_max * 1000:.2f}')
+        if stats is None:
+            st.info('Инструментирование запросов недоступно')
+            return
+
+        st.caption(f'Подключений: {stats.connections}, выдач из пула: {stats.checkouts}, '
+                   f'порог медленного запроса: {stats.slow_threshold_ms:.0f} мс')
+        statements = stats.statements()
+        if not statements:
+            st.info('Запросы ещё не выполнялись')
+        else:
+            st.dataframe([
+                {
+                    'Запрос': item.statement,
+                    'Вызовов': item.calls,
+                    'Строк': item.rows,
+                    'Всего, мс': round(item.total_ms, 2),
+                    'Среднее, мс': round(item.mean_ms, 2),
+                    'p95, мс': round(item.percentile_ms(0.95), 2),
+                    'Макс., мс': round(item.max_ms, 2),
+                }
+                for item in statements
+            ], use_container_width=True)
+            selected = st.selectbox('Гистограмма задержек', range(len(statements)),
+                                    format_func=lambda index: statements[index].statement)
+            st.bar_chart({
+                f'≤{bound:g} мс': count
+                for bound, count in zip(BUCKETS_MS, statements[selected].buckets)
+            })
+
+        st.markdown('**Медленные запросы**')
+        slow_queries = stats.slow_queries()
+        if not slow_queries:
+            st.info('Медленных запросов нет')
+        else:
+            st.dataframe([
+                {
+                    'Время': time.strftime('%H:%M:%S', time.localtime(query.timestamp)),
+                    'Длительность, мс': round(query.duration_ms, 2),
+                    'Строк': query.rowcount,
+                    'Запрос': query.statement,
+                }
+                for query in slow_queries
+            ], use_container_width=True)
+        st.button('Сбросить статистику', key='reset_query_stats', on_click=stats.reset)
+
+    def _signup_user(self, login: str, password: str, repeat_password: str) -> None:
+        if not login or not password:
+            st.error('Идентификатор и пароль не могут быть пустыми!')
+        elif password != repeat_password:
+            st.error('Пароли не совпадают!')
+        else:
+            try:
+                get_credential_store().add_user(login, password)
+            except KeyError:
+                st.error('Пользователь с таким идентификатором уже существует!')
+            else:
+                st.success(f'Пользователь {login} успешно добавлен! Теперь можно войти в систему.')
 
     def _authenticate(self, user_type: Literal['admin', 'user', 'guest'],
                       credentials: tuple[str, str]) -> AuthenticationStatus:        
@@ -233,51 +430,147 @@ class App:
         return AuthenticationStatus.ADMIN_FAILURE
     
     def _authenticate_user(self, credentials: tuple[str, str]) -> AuthenticationStatus:
-        with open('users.json', encoding='utf-8') as file:
-            users: dict[str, str] = json.load(file)
-        if credentials[0] not in users:
+        password = get_credential_store().get_password(credentials[0])
+        if password is None:
             return AuthenticationStatus.NON_EXISTENT_USER
-        elif users.get(credentials[0]) != credentials[1]:
+        elif password != credentials[1]:
             return AuthenticationStatus.WRONG_PASSWORD
         return AuthenticationStatus.SUCCESS
     
     def _get_students_amount(self) -> None:        
+        from model import CountMode
         try:       
-            students_amount = self._db.get_students_amount()
+            students_amount = self._db.get_students_amount(CountMode.CACHED)
             st.toast(f'Количество учащихся: {students_amount}')       
             st.info(f'Количество учащихся: {students_amount}')
-        except Exception as e:
-            print('DB is empty!')
+        except Exception:
+            logger.exception('Failed to count students')
             st.error('Ошибка во время получения количества студентов')
             st.toast('Ошибка во время получения количества студентов')
     
-    def _get_students(self) -> None:        
-        try:       
-            students = self._db.get_students()        
-            for student in students:
-                st.write(student)
+    @st.fragment
+    def _get_students(self, page_size_options: tuple[int, ...] = (25, 50, 100, 500)) -> None:
+        from model import CountMode, StudentOrder
+        order_labels = {
+            StudentOrder.ID: 'По идентификатору',
+            StudentOrder.NAME: 'По фамилии и имени',
+            StudentOrder.GROUP: 'По группе',
+        }
+        try:
+            # Количество берётся из кэша, чтобы листание не пересчитывало таблицу
+            students_amount = self._db.get_students_amount(CountMode.CACHED)
+        except Exception as e:
+            logger.exception('Failed to count students')
+            st.error(f'Ошибка во время получения списка студентов: {e}')
+            st.toast(f'Ошибка во время получения списка студентов: база данных отсутствует!')
+            return
+
+        order_col, direction_col, size_col, page_col = st.columns(4)
+        order_by = order_col.selectbox('Сортировка', list(order_labels),
+                                       format_func=order_labels.get, key='students_order')
+        descending = direction_col.toggle('По убыванию', key='students_descending')
+        page_size = size_col.selectbox('Строк на странице', page_size_options,
+                                       index=1, key='students_page_size')
+        pages = max(1, math.ceil(students_amount / page_size))
+        page = page_col.number_input(f'Страница (из {pages})', min_value=1, max_value=pages,
+                                     value=1, step=1, key='students_page')
+        # По идентификатору листаем по ключу: последний id каждой показанной
+        # страницы запоминается, и следующая начинается сразу после него без
+        # OFFSET. Для сортировки по имени и группе ключ составной и неуникальный,
+        # там остаётся OFFSET — окна размером со страницу браузера, и при
+        # переходе на произвольную страницу курсора всё равно нет
+        # Любая вставка или удаление сдвигает страницы, поэтому курсоры
+        # сбрасываются после каждого изменения таблицы
+        cursors = st.session_state.setdefault('students_cursors', {})
+        page_cursors = cursors.setdefault((order_by, descending, page_size), {})
+        after_id = page_cursors.get(page - 1) if order_by == StudentOrder.ID else None
+        try:
+            table = self._db.get_students_table(page - 1, page_size, order_by, descending,
+                                                after_id=after_id)
         except Exception as e:
-            print('DB is empty!')
+            logger.exception('Failed to list students')
             st.error(f'Ошибка во время получения списка студентов: {e}')
-            st.toast(f'Ошибка во время получения списка студентов: база данных отсутствует!')    
-   
+            return
+        if order_by == StudentOrder.ID and table.num_rows:
+            page_cursors[page] = table['id'][-1].as_py()
+        st.dataframe(table, hide_index=True, use_container_width=True)
+        st.caption(f'Всего учащихся: {students_amount}')
+
     def _delete_database(self) -> None:
         self._db.delete_database()
+        st.session_state.pop('students_cursors', None)
         st.toast('База данных успешно удалена!')
     
     def _create_student(self, first_name: str, last_name: str, group: str) -> None:
-        print(first_name, last_name, group)
         try:                    
             self._db.create_student(first_name, last_name, int(group))
         except Exception as e:
-            print(f'Error: {e}')                    
+            logger.exception('Failed to create student %s %s (group %s)', last_name, first_name, group)
             st.error(f'Ошибка во время добавления студента: {e}')
             st.toast(f'Ошибка во время добавления студента: {e}')
         else:
+            st.session_state.pop('students_cursors', None)
             st.toast('Студент успешно добавлен в базу данных!')
             st.success('Студент успешно добавлен в базу данных!')
 
+    def _create_record(self, store: LogStore, key: str, value: str) -> bool:
+        if not key:
+            st.error('Идентификатор данных не может быть пустым!')
+            return False
+        try:
+            store.create(key, value)
+        except KeyError as e:
+            st.error(e.args[0])
+            return False
+        st.success(f'Данные успешно созданы: {key}')
+        return True
+
+    def _update_record(self, store: LogStore, key: str, value: str) -> bool:
+        try:
+            store.update(key, value)
+        except KeyError as e:
+            st.error(e.args[0])
+            return False
+        st.success(f'Данные успешно изменены: {key}')
+        return True
+
+    def _delete_record(self, store: LogStore, key: str) -> bool:
+        try:
+            store.delete(key)
+        except KeyError as e:
+            st.error(e.args[0])
+            return False
+        st.success(f'Данные успешно удалены: {key}')
+        return True
+
+    def _search_records(self, search: RecordSearch, store: LogStore, query: str,
+                        prefix: bool, show_values: bool = True) -> None:
+        keys = search.search(query, k=20, prefix=prefix)
+        if not keys:
+            st.warning('По данному запросу ничего не найдено')
+            return
+        for key in keys:
+            st.write(f'{key}: {store.get(key)}' if show_values else key)
+
+    def _create_students_bulk(self, students: Iterable[tuple[str, str, int]],
+                              batch_size: int = 1000) -> None:
+        # Даже неудачная загрузка могла успеть записать первые пакеты
+        st.session_state.pop('students_cursors', None)
+        try:
+            report = self._db.create_students_bulk(students, batch_size=batch_size)
+        except Exception as e:
+            logger.exception('Bulk student insert failed')
+            st.error(f'Ошибка во время пакетного добавления студентов: {e}')
+            st.toast(f'Ошибка во время пакетного добавления студентов: {e}')
+        else:
+            message = (f'Добавлено студентов: {report.rows} за {report.elapsed:.2f} с '
+                       f'({report.rows_per_second:.0f} строк/с, {report.method})')
+            st.toast(message)
+            st.success(message)
+
 
 if __name__ == '__main__':
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     app = App()
     app.run()
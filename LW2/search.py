@@ -0,0 +1,281 @@
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Iterator
+import threading
+import hashlib
+import secrets
+import bisect
+import heapq
+import hmac
+import math
+import os
+import re
+
+from storage import DELETE, LogStore, get_log_store
+
+
+_TOKEN_RE = re.compile(r'\w+')
+# Postings read from one stream between two checks of the stopping condition
+_SEARCH_BATCH = 32
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def confidential_digest(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+class InvertedIndex:
+    # Postings are bucketed by term frequency, so each term can be read in
+    # descending impact order. search() walks those lists in step and stops
+    # once no unread record can beat the current k-th best (threshold
+    # algorithm), instead of scoring every posting.
+
+    def __init__(self, prefix_lookups: bool = True) -> None:
+        self._lock = threading.RLock()
+        self._postings: dict[str, dict[int, dict[str, None]]] = {}
+        self._frequencies: dict[str, int] = {}
+        self._documents: dict[str, Counter[str]] = {}
+        # Sorted vocabulary, kept only when prefix queries are needed
+        self._terms: list[str] | None = [] if prefix_lookups else None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, record_id: str, terms: Iterable[str]) -> None:
+        counts = Counter(terms)
+        with self._lock:
+            self._remove(record_id)
+            if not counts:
+                return
+            self._documents[record_id] = counts
+            for term, frequency in counts.items():
+                buckets = self._postings.get(term)
+                if buckets is None:
+                    buckets = self._postings[term] = {}
+                    self._frequencies[term] = 0
+                    if self._terms is not None:
+                        bisect.insort(self._terms, term)
+                buckets.setdefault(frequency, {})[record_id] = None
+                self._frequencies[term] += 1
+
+    def remove(self, record_id: str) -> None:
+        with self._lock:
+            self._remove(record_id)
+
+    def _remove(self, record_id: str) -> None:
+        counts = self._documents.pop(record_id, None)
+        if counts is None:
+            return
+        for term, frequency in counts.items():
+            buckets = self._postings[term]
+            bucket = buckets[frequency]
+            del bucket[record_id]
+            if not bucket:
+                del buckets[frequency]
+            self._frequencies[term] -= 1
+            if not buckets:
+                del self._postings[term]
+                del self._frequencies[term]
+                if self._terms is not None:
+                    del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _expand(self, prefix: str) -> list[str]:
+        if self._terms is None:
+            return [prefix]
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + '\U0010ffff', start)
+        return self._terms[start:end]
+
+    def _impacts(self, term: str, idf: float) -> Iterator[tuple[float, str]]:
+        buckets = self._postings[term]
+        for frequency in sorted(buckets, reverse=True):
+            impact = frequency * idf
+            for record_id in buckets[frequency]:
+                yield impact, record_id
+
+    def search(self, terms: Iterable[str], k: int = 10,
+               prefix: bool = False) -> list[tuple[str, float]]:
+        # Each query term scores tf-idf against the best matching indexed
+        # term: itself, or for prefix queries the best of its expansions
+        with self._lock:
+            total = len(self._documents)
+            weights: list[dict[str, float]] = []
+            streams: list[Iterator[tuple[float, str]]] = []
+            for term in terms:
+                matches = {
+                    match: math.log(1 + total / self._frequencies[match])
+                    for match in (self._expand(term) if prefix else (term,))
+                    if match in self._postings
+                }
+                if len(matches) == 1:
+                    weights.append(matches)
+                    streams.append(self._impacts(*next(iter(matches.items()))))
+                elif matches:
+                    weights.append(matches)
+                    streams.append(heapq.merge(
+                        *(self._impacts(match, idf) for match, idf in matches.items()),
+                        key=lambda item: item[0], reverse=True
+                    ))
+            if k < 1 or not streams:
+                return []
+
+            heads = [next(stream, None) for stream in streams]
+            top: list[tuple[float, str]] = []
+            seen: set[str] = set()
+            while True:
+                # No record that is still unseen can score above this
+                threshold = sum(head[0] for head in heads if head is not None)
+                kth = top[0][0] if len(top) == k else 0.0
+                if threshold == 0 or kth >= threshold:
+                    break
+                # Streams whose heads together cannot lift a record past the
+                # k-th best are only scored through the documents; the rest
+                # are advanced
+                bound = 0.0
+                for position in sorted(range(len(heads)), key=lambda position: (
+                        heads[position][0] if heads[position] is not None else 0.0)):
+                    head = heads[position]
+                    if head is None:
+                        continue
+                    bound += head[0]
+                    if bound <= kth:
+                        continue
+                    # A short run per stream keeps the bookkeeping above off
+                    # the per-posting path; reading a little past the stopping
+                    # point does not change the result
+                    stream = streams[position]
+                    for _ in range(_SEARCH_BATCH):
+                        record_id = head[1]
+                        if record_id not in seen:
+                            seen.add(record_id)
+                            score = self._score(self._documents[record_id], weights)
+                            if len(top) < k:
+                                heapq.heappush(top, (score, record_id))
+                            elif score > top[0][0]:
+                                heapq.heapreplace(top, (score, record_id))
+                        head = next(stream, None)
+                        if head is None:
+                            break
+                    heads[position] = head
+            return [(record_id, score) for score, record_id in sorted(top, reverse=True)]
+
+    @staticmethod
+    def _score(counts: Counter[str], weights: list[dict[str, float]]) -> float:
+        score = 0.0
+        for matches in weights:
+            best = 0.0
+            if len(matches) <= len(counts):
+                for match, idf in matches.items():
+                    frequency = counts.get(match)
+                    if frequency and frequency * idf > best:
+                        best = frequency * idf
+            else:
+                for term, frequency in counts.items():
+                    idf = matches.get(term)
+                    if idf is not None and frequency * idf > best:
+                        best = frequency * idf
+            score += best
+        return score
+
+
+class RecordSearch:
+
+    def __init__(self, store: LogStore, prefix_lookups: bool = True) -> None:
+        self._index = InvertedIndex(prefix_lookups=prefix_lookups)
+        store.subscribe(self._on_change, replay=True)
+
+    def _record_terms(self, value) -> list[str]:
+        return tokenize(value)
+
+    def _on_change(self, op: str, key: str, value) -> None:
+        if op == DELETE:
+            self._index.remove(key)
+        else:
+            self._index.add(key, self._record_terms(value))
+
+    def search(self, query: str, k: int = 10, prefix: bool = True) -> list[str]:
+        return [key for key, _ in self._index.search(tokenize(query), k, prefix)]
+
+
+class ConfidentialSearch(RecordSearch):
+    # Confidential values are only kept as digests, so the index is built from
+    # keyed hashes of their tokens (and token prefixes) computed at write time
+    # and persisted in a side log. Queries are hashed the same way.
+
+    def __init__(self, records: LogStore, terms: LogStore, key: bytes,
+                 min_prefix: int = 3) -> None:
+        self._key = key
+        self._min_prefix = min_prefix
+        self._terms = terms
+        for record_id in records.keys():
+            if record_id not in terms:
+                digest = records.get(record_id)
+                if digest is not None:
+                    terms.put(record_id, [f'd:{digest}'])
+        super().__init__(terms, prefix_lookups=False)
+
+    def _hash(self, kind: str, token: str) -> str:
+        message = f'{kind}:{token}'.encode('utf-8')
+        return f'{kind}:{hmac.new(self._key, message, hashlib.sha256).hexdigest()[:32]}'
+
+    def _record_terms(self, value) -> list[str]:
+        return list(value)
+
+    def hash_terms(self, value: str) -> list[str]:
+        terms = [f'd:{confidential_digest(value)}']
+        for token in tokenize(value):
+            terms.append(self._hash('t', token))
+            for length in range(self._min_prefix, len(token) + 1):
+                terms.append(self._hash('p', token[:length]))
+        return terms
+
+    def index(self, record_id: str, value: str) -> None:
+        self._terms.put(record_id, self.hash_terms(value))
+
+    def unindex(self, record_id: str) -> None:
+        if record_id in self._terms:
+            self._terms.delete(record_id)
+
+    def search(self, query: str, k: int = 10, prefix: bool = True) -> list[str]:
+        terms = [f'd:{confidential_digest(query)}']
+        for token in tokenize(query):
+            kind = 'p' if prefix and len(token) >= self._min_prefix else 't'
+            terms.append(self._hash(kind, token))
+        return [key for key, _ in self._index.search(terms, k)]
+
+
+def _load_search_key() -> bytes:
+    if key := os.getenv('SEARCH_INDEX_KEY'):
+        return bytes.fromhex(key)
+    path = os.path.join(os.getenv('STORAGE_DIR', '.'), 'search.key')
+    try:
+        with open(path, 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        key = secrets.token_bytes(32)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(key)
+        return key
+
+
+_searches: dict[str, RecordSearch] = {}
+_searches_lock = threading.Lock()
+
+
+def get_search(name: str) -> RecordSearch:
+    search = _searches.get(name)
+    if search is not None:
+        return search
+    with _searches_lock:
+        search = _searches.get(name)
+        if search is None:
+            if name == 'conf':
+                search = ConfidentialSearch(get_log_store('conf'), get_log_store('conf.terms'),
+                                            _load_search_key())
+            else:
+                search = RecordSearch(get_log_store(name))
+            _searches[name] = search
+        return search
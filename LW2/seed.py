@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Iterator
+from faker import Faker
+import argparse
+import os
+
+from model import DBWorker, StudentRow
+
+
+def generate_chunk(seed: int, chunk: int, size: int, locale: str = 'ru_RU') -> list[StudentRow]:
+    # Each chunk has its own seed, so the data set does not depend on how
+    # many workers generated it or in which order they finished.
+    fake = Faker(locale)
+    fake.seed_instance(seed * 1_000_003 + chunk)
+    return [
+        (fake.first_name(), fake.last_name(), fake.random_int(100_000, 999_999))
+        for _ in range(size)
+    ]
+
+
+def generate_students(count: int, seed: int = 0, chunk_size: int = 10_000,
+                      workers: int | None = None, locale: str = 'ru_RU') -> Iterator[StudentRow]:
+    sizes = [min(chunk_size, count - start) for start in range(0, count, chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map keeps chunk order, so inserted ids are reproducible too
+        for chunk in pool.map(generate_chunk, [seed] * len(sizes), range(len(sizes)), sizes,
+                              [locale] * len(sizes)):
+            yield from chunk
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fill the student table with Faker data')
+    parser.add_argument('count', type=int)
+    parser.add_argument('--url', default=None,
+                        help='SQLAlchemy URL; defaults to DB_URL or the DB_* variables')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--locale', default='ru_RU')
+    parser.add_argument('--recreate', action='store_true', help='drop and recreate the schema first')
+    args = parser.parse_args()
+
+    db = DBWorker(args.url)
+    if args.recreate:
+        db.delete_database()
+    db.create_database()
+    students = generate_students(args.count, args.seed, args.chunk_size, args.workers, args.locale)
+    report = db.create_students_bulk(students, batch_size=args.batch_size)
+    print(f'inserted {report.rows} students in {report.elapsed:.2f} s '
+          f'({report.rows_per_second:.0f} rows/s, {report.method})')
+
+
+if __name__ == '__main__':
+    main()
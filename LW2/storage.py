@@ -0,0 +1,236 @@
+from collections.abc import Callable, Iterator
+import threading
+import logging
+import atexit
+import json
+import os
+
+
+logger = logging.getLogger(__name__)
+
+PUT = 'put'
+DELETE = 'del'
+
+Listener = Callable[[str, str, object], None]
+
+
+class LogStore:
+
+    def __init__(self, path: str, seed_path: str | None = None,
+                 fsync_interval: float = 0.05, compact_interval: float = 30.0,
+                 compact_ratio: float = 0.5, compact_min_bytes: int = 1 << 20) -> None:
+        self._path = path
+        self._lock = threading.RLock()
+        self._index: dict[str, tuple[int, int]] = {}
+        self._listeners: list[Listener] = []
+        self._size = 0
+        self._garbage = 0
+        self._dirty = False
+        self._key_counters: dict[str, int] = {}
+        self._fsync_interval = fsync_interval
+        self._compact_interval = compact_interval
+        self._compact_ratio = compact_ratio
+        self._compact_min_bytes = compact_min_bytes
+        seed = not os.path.exists(path) and seed_path is not None and os.path.exists(seed_path)
+        self._fd = self._open()
+        self._load()
+        if seed:
+            with open(seed_path, encoding='utf-8') as file:
+                for key, value in json.load(file).items():
+                    self.put(key, value)
+            self.flush()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._background, name=f'logstore-{path}',
+                                        daemon=True)
+        self._worker.start()
+
+    def _open(self) -> int:
+        return os.open(self._path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+
+    def _load(self) -> None:
+        offset = 0
+        with open(self._path, 'rb') as file:
+            for number, line in enumerate(file, start=1):
+                if not line.endswith(b'\n'):
+                    # Only the last line can lack a newline: a torn record
+                    # left by a crash mid-write, dropped below
+                    break
+                try:
+                    op, key, _ = json.loads(line)
+                    if op not in (PUT, DELETE) or not isinstance(key, str):
+                        raise ValueError(f'unknown record {op!r}')
+                except ValueError as e:
+                    # A damaged record in the middle is skipped, not used as
+                    # the end of the log; compaction drops it later
+                    logger.warning('%s: skipping damaged record %d at offset %d: %s',
+                                   self._path, number, offset, e)
+                    self._garbage += len(line)
+                else:
+                    self._apply(op, key, offset, len(line))
+                offset += len(line)
+        if offset != os.fstat(self._fd).st_size:
+            logger.warning('%s: dropping torn record at offset %d', self._path, offset)
+            os.ftruncate(self._fd, offset)
+        self._size = offset
+
+    def _apply(self, op: str, key: str, offset: int, length: int) -> None:
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self._garbage += previous[1]
+        if op == PUT:
+            self._index[key] = (offset, length)
+        else:
+            self._garbage += length
+
+    def _append(self, op: str, key: str, value: object = None) -> None:
+        record = json.dumps([op, key, value], ensure_ascii=False).encode('utf-8') + b'\n'
+        os.write(self._fd, record)
+        self._apply(op, key, self._size, len(record))
+        self._size += len(record)
+        self._dirty = True
+        for listener in self._listeners:
+            listener(op, key, value)
+
+    def _read(self, key: str):
+        location = self._index.get(key)
+        if location is None:
+            return None
+        offset, length = location
+        _, _, value = json.loads(os.pread(self._fd, length, offset))
+        return value
+
+    def subscribe(self, listener: Listener, replay: bool = False) -> None:
+        with self._lock:
+            if replay:
+                for key in self._index:
+                    listener(PUT, key, self._read(key))
+            self._listeners.append(listener)
+
+    def get(self, key: str):
+        with self._lock:
+            return self._read(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._index)
+
+    def items(self) -> Iterator[tuple[str, object]]:
+        for key in self.keys():
+            value = self.get(key)
+            if value is not None:
+                yield key, value
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._append(PUT, key, value)
+
+    def create(self, key: str, value) -> None:
+        with self._lock:
+            if key in self._index:
+                raise KeyError(f'Запись с идентификатором {key} уже существует!')
+            self._append(PUT, key, value)
+
+    def update(self, key: str, value) -> None:
+        with self._lock:
+            if key not in self._index:
+                raise KeyError(f'Записи с идентификатором {key} не существует!')
+            self._append(PUT, key, value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key not in self._index:
+                raise KeyError(f'Записи с идентификатором {key} не существует!')
+            self._append(DELETE, key)
+
+    def next_key(self, prefix: str) -> str:
+        with self._lock:
+            if prefix not in self._key_counters:
+                suffixes = [int(key[len(prefix):]) for key in self._index
+                            if key.startswith(prefix) and key[len(prefix):].isdigit()]
+                self._key_counters[prefix] = max(suffixes, default=0)
+            while True:
+                self._key_counters[prefix] += 1
+                key = f'{prefix}{self._key_counters[prefix]}'
+                if key not in self._index:
+                    return key
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                os.fsync(self._fd)
+                self._dirty = False
+
+    def compact(self) -> None:
+        with self._lock:
+            temp_path = f'{self._path}.compact'
+            index: dict[str, tuple[int, int]] = {}
+            offset = 0
+            with open(temp_path, 'wb') as file:
+                for key, (old_offset, length) in self._index.items():
+                    file.write(os.pread(self._fd, length, old_offset))
+                    index[key] = (offset, length)
+                    offset += length
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self._path)
+            os.close(self._fd)
+            self._fd = self._open()
+            self._index = index
+            self._size = offset
+            self._garbage = 0
+            self._dirty = False
+
+    def needs_compaction(self) -> bool:
+        return (self._size >= self._compact_min_bytes
+                and self._garbage >= self._size * self._compact_ratio)
+
+    def _background(self) -> None:
+        # Writes only append; fsync is batched here so bursts of edits share
+        # one disk flush per interval instead of paying for one each.
+        since_compaction = 0.0
+        while not self._stop.wait(self._fsync_interval):
+            self.flush()
+            since_compaction += self._fsync_interval
+            if since_compaction >= self._compact_interval:
+                since_compaction = 0.0
+                if self.needs_compaction():
+                    self.compact()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._worker.join()
+        with self._lock:
+            self.flush()
+            os.close(self._fd)
+
+
+_stores: dict[str, LogStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_log_store(name: str) -> LogStore:
+    store = _stores.get(name)
+    if store is not None:
+        return store
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            directory = os.getenv('STORAGE_DIR', '.')
+            store = LogStore(os.path.join(directory, f'{name}.log'),
+                             seed_path=os.path.join(directory, f'{name}.json'))
+            _stores[name] = store
+        return store
+
+
+@atexit.register
+def _close_stores() -> None:
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from storage import LogStore
+
+
+@pytest.fixture
+def log_path(tmp_path) -> str:
+    return str(tmp_path / 'records.log')
+
+
+def _write_records(path: str, *lines: bytes) -> None:
+    with open(path, 'wb') as file:
+        file.write(b''.join(lines))
+
+
+def _record(op: str, key: str, value=None) -> bytes:
+    return json.dumps([op, key, value]).encode() + b'\n'
+
+
+def _open(path: str) -> LogStore:
+    return LogStore(path, fsync_interval=3600, compact_interval=3600)
+
+
+@pytest.mark.parametrize('damaged', [
+    b'{"not": "a record"\n',
+    b'\x00\x00\x00garbage\n',
+    _record('bogus', 'second', 'value'),
+    b'["put", 2, "value"]\n',
+])
+def test_damaged_middle_record_keeps_later_records(log_path, damaged):
+    _write_records(log_path, _record('put', 'first', 'one'), damaged,
+                   _record('put', 'third', 'three'), _record('del', 'first'))
+    size = len(open(log_path, 'rb').read())
+
+    store = _open(log_path)
+    try:
+        assert store.keys() == ['third']
+        assert store.get('third') == 'three'
+        assert store.get('first') is None
+        store.put('fourth', 'four')
+    finally:
+        store.close()
+    # Nothing after the damaged record was cut off, and the new write landed
+    # after the old records
+    with open(log_path, 'rb') as file:
+        assert len(file.read()) > size
+
+    store = _open(log_path)
+    try:
+        assert sorted(store.keys()) == ['fourth', 'third']
+    finally:
+        store.close()
+
+
+def test_torn_last_record_is_dropped(log_path):
+    complete = _record('put', 'first', 'one')
+    _write_records(log_path, complete, b'["put", "sec')
+
+    store = _open(log_path)
+    try:
+        assert store.keys() == ['first']
+        store.put('second', 'two')
+    finally:
+        store.close()
+
+    store = _open(log_path)
+    try:
+        assert store.get('second') == 'two'
+    finally:
+        store.close()
@@ -1,93 +1,169 @@
+import time
+
+# Taken before the other imports so the first-render timing includes them
+_script_started = time.perf_counter()
+
+from typing import TYPE_CHECKING
 import streamlit as st
-import psutil
-from cryptography.fernet import Fernet
-import tracemalloc
-from dataclasses import dataclass
+import logging
+import io
+import os
 
+from store import (
+    DecryptedCache,
+    MemoryStore,
+    ShardedStore,
+    create_sharded_store,
+    create_store
+)
+from bulk import export_records, import_records, parse_records
 
-tracemalloc.start()
+# rotation pulls in cryptography and profiler pulls in psutil/tracemalloc;
+# both are imported when the store or the memory panel is first needed
+if TYPE_CHECKING:
+    from profiler import BackgroundProfiler
+    from rotation import KeyRotation
 
 
-@dataclass
-class Data:
-    data: str
-    is_confidential: bool
+logger = logging.getLogger(__name__)
 
 
 st.set_page_config(page_title='Работа с ОЗУ', layout='wide')
 
-if not 'memory' in st.session_state:
-    st.session_state['memory'] = {}
-memory: dict[str, Data] = st.session_state['memory']
+persist_dir = os.getenv('MEMORY_PERSIST_DIR')
+key_file = os.getenv('FERNET_KEY_FILE') or (
+    os.path.join(persist_dir, 'fernet.key') if persist_dir else None
+)
+if persist_dir:
+    os.makedirs(persist_dir, exist_ok=True)
+store_mode = os.getenv('MEMORY_STORE_MODE', 'dict')
+# 'shared': one store for every session of the process; 'session': the old
+# private per-session store (never persisted)
+store_scope = os.getenv('MEMORY_SCOPE', 'shared')
+memory_panel_refresh = float(os.getenv('MEMORY_PANEL_REFRESH', '5'))
+
+
+def make_cache(parts: int = 1) -> DecryptedCache | None:
+    cache_entries = int(os.getenv('DECRYPTED_CACHE_ENTRIES', '0'))
+    if cache_entries <= 0:
+        return None
+    return DecryptedCache(
+        max_entries=max(1, cache_entries // parts),
+        max_bytes=max(1, int(os.getenv('DECRYPTED_CACHE_BYTES', str(1 << 20))) // parts),
+        ttl=float(os.getenv('DECRYPTED_CACHE_TTL', '60'))
+    )
+
+
+@st.cache_resource
+def get_shared_store() -> ShardedStore:
+    from rotation import KeyRing
+    store = create_sharded_store(store_mode, KeyRing.load(key_file),
+                                 shards=int(os.getenv('MEMORY_SHARDS', '16')),
+                                 cache_factory=make_cache, persist_dir=persist_dir)
+    store.schedule_snapshots(float(os.getenv('SNAPSHOT_INTERVAL', '60')))
+    return store
+
+
+@st.cache_resource
+def get_shared_rotation() -> 'KeyRotation':
+    store = get_shared_store()
+    return make_rotation(store, key_file)
+
+
+def make_rotation(store: MemoryStore | ShardedStore, path: str | None) -> 'KeyRotation':
+    from rotation import KeyRotation
+    return KeyRotation(store, store.cipher, path,
+                       batch_size=int(os.getenv('ROTATION_BATCH_SIZE', '100')),
+                       pause=float(os.getenv('ROTATION_PAUSE', '0.05')))
+
 
-if not 'encryption_key' in st.session_state:
-    st.session_state['encryption_key'] = Fernet.generate_key()
-encryption_key = st.session_state['encryption_key']
+# The store (and its key) is opened by the first data operation, not by the
+# first paint
+def get_memory() -> MemoryStore | ShardedStore:
+    if not 'memory' in st.session_state:
+        if store_scope == 'shared':
+            st.session_state['memory'] = get_shared_store()
+        else:
+            from rotation import KeyRing
+            st.session_state['memory'] = create_store(store_mode, KeyRing.load(), make_cache())
+    return st.session_state['memory']
 
-if not 'cipher' in st.session_state:
-    st.session_state['cipher'] = Fernet(encryption_key)
-cipher: Fernet = st.session_state['cipher']
+
+def get_rotation() -> 'KeyRotation':
+    if not 'rotation' in st.session_state:
+        if store_scope == 'shared':
+            st.session_state['rotation'] = get_shared_rotation()
+        else:
+            st.session_state['rotation'] = make_rotation(get_memory(), None)
+    return st.session_state['rotation']
 
 if not 'step' in st.session_state:
     st.session_state['step'] = 'Запуск системы'
-step = st.session_state['step']
 
-if not 'last_snapshot' in st.session_state:
-    tracemalloc.start()
-    snapshot = tracemalloc.take_snapshot()
-    st.session_state['last_snapshot'] = snapshot
-    tracemalloc.stop()
+
+# tracemalloc starts with the profiler, i.e. the first time a session opens
+# the memory panel
+@st.cache_resource
+def get_profiler() -> 'BackgroundProfiler':
+    from profiler import BackgroundProfiler
+    profiler = BackgroundProfiler(
+        interval=float(os.getenv('PROFILER_INTERVAL', '5')),
+        frame_depth=int(os.getenv('PROFILER_FRAME_DEPTH', '1')),
+        include=[os.path.dirname(os.path.abspath(__file__))]
+    )
+    profiler.start()
+    return profiler
 
 
 def upload_data(_id: str, data: str, confidential: bool = False) -> None:
-    if not get_data(_id) is None:
-        raise KeyError('Данные по данному идентификатору уже существуют!')
-    if confidential:
-        data = cipher.encrypt(data.encode()).decode()
-    st.session_state['memory'][_id] = Data(data, confidential)
+    get_memory().upload(_id, data, confidential)
 
 def get_data(_id: str) -> str | None:
-    data: Data | None = st.session_state['memory'].get(_id)
-    if data is None:
-        return None
-    if data.is_confidential:
-        return cipher.decrypt(data.data.encode()).decode()
-    return data.data
+    return get_memory().get(_id)
 
 def update_data(_id: str, data: str, confidential: bool = False) -> None:
-    if get_data(_id) is None:
-        raise KeyError('Данных по данному адресу не существует!')
-    if confidential:
-        data = cipher.encrypt(data.encode()).decode()
-    st.session_state['memory'][_id] = Data(data, confidential)
+    get_memory().update(_id, data, confidential)
 
 def delete_data(_id: str) -> None:
-    if get_data(_id) is None:
-        raise KeyError('Данных по данному адресу не существует!')
-    del st.session_state['memory'][_id]
+    get_memory().delete(_id)
 
 def dump_memory(step: str):
-    tracemalloc.start()
-    snapshot = tracemalloc.take_snapshot()
+    sample = get_profiler().latest()
     st.write(f"Дамп памяти ({step}):")
-    top_diffs = snapshot.compare_to(st.session_state['last_snapshot'], 'lineno')
-    top_stats = snapshot.statistics('lineno')
-    st.session_state['last_snapshot'] = snapshot    
-    tracemalloc.stop()
+    if sample is None:
+        return ['Профилировщик ещё не собрал данные']
     result = [f"{'=' * 5} TOP STATS {'=' * 5}"]
-    result.extend(list(map(str, top_stats[:10])))
+    result.extend(sample.top_stats)
     result.append(f"{'=' * 5} TOP DIFFS {'=' * 5}")
-    result.extend(list(map(str, top_diffs[:10])))
+    result.extend(sample.top_diffs)
     return result
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def store_usage(store_id: int, entries: int, sample_time: float | None) -> str:
+    # footprint() walks every entry, so it is only recomputed when the store
+    # size changes or the profiler takes a new sample
+    store_stats = get_memory().memory_stats()
+    return (
+        f"Хранилище ({store_stats.mode}): {store_stats.entries} записей, "
+        f"{store_stats.total_bytes / 1024:.2f} KB в памяти, "
+        f"{store_stats.mapped_bytes / 1024:.2f} KB в снимке, "
+        f"{store_stats.bytes_per_entry:.1f} байт на запись"
+    )
+
 def system_usage():
-    process = psutil.Process()
-    memory_info = process.memory_info()
-    cpu_times = process.cpu_times()
+    sample = get_profiler().latest()
+    if sample is None:
+        import psutil
+        process = psutil.Process()
+        rss, cpu_times = process.memory_info().rss, process.cpu_times()
+        cpu_user, cpu_system = cpu_times.user, cpu_times.system
+    else:
+        rss, cpu_user, cpu_system = sample.rss, sample.cpu_user, sample.cpu_system
     return (
-        f"Использование ОЗУ: {memory_info.rss / 1024 ** 2:.2f} MB\n\n"
-        f"Процессорное время (пользователь): {cpu_times.user:.2f} s\n\n"
-        f"Процессорное время (система): {cpu_times.system:.2f} s"
+        f"Использование ОЗУ: {rss / 1024 ** 2:.2f} MB\n\n"
+        f"Процессорное время (пользователь): {cpu_user:.2f} s\n\n"
+        f"Процессорное время (система): {cpu_system:.2f} s\n\n"
+        + store_usage(id(get_memory()), len(get_memory()), sample.timestamp if sample else None)
     )    
 
 def choise_format_func(option: str) -> str:
@@ -95,7 +171,9 @@ def choise_format_func(option: str) -> str:
         'upload': 'Добавить данные',
         'get': 'Получить данные',
         'update': 'Изменить данные',
-        'delete': 'Удалить данные'
+        'delete': 'Удалить данные',
+        'import': 'Импортировать данные',
+        'export': 'Экспортировать данные'
     }[option]
 
 def main_view() -> None:
@@ -103,7 +181,7 @@ def main_view() -> None:
     with data_col:
         choise = st.selectbox(label='Выберите действие', key='choise',
                               format_func=choise_format_func,
-                              options=['upload', 'get', 'update', 'delete'])
+                              options=['upload', 'get', 'update', 'delete', 'import', 'export'])
         match choise:
             case 'upload':
                 render_upload()
@@ -113,12 +191,44 @@ def main_view() -> None:
                 render_update()
             case 'delete':
                 render_delete()
+            case 'import':
+                render_import()
+            case 'export':
+                render_export()
     with memory_col:
-        with st.empty().container(height=700):
-            st.write('\n\n'.join(dump_memory(step)))
-            st.divider()
-            st.write(system_usage())
+        if st.toggle('Панель памяти и процессора', key='memory_panel'):
+            render_memory_panel()
+        else:
+            st.caption('Профилирование памяти включится при открытии панели')
+
+# The panel refreshes on its own timer; CRUD forms are fragments too, so a
+# submit reruns only the form instead of the whole page.
+@st.fragment(run_every=memory_panel_refresh)
+def render_memory_panel() -> None:
+    with st.container(height=700):
+        st.write('\n\n'.join(dump_memory(st.session_state['step'])))
+        st.divider()
+        st.write(system_usage())
+        history = get_profiler().history()
+        if history:
+            st.line_chart({'RSS, MB': [sample.rss / 1024 ** 2 for sample in history],
+                           'CPU, %': [sample.cpu_percent for sample in history]})
+        st.divider()
+        render_rotation()
 
+def render_rotation() -> None:
+    rotation = get_rotation()
+    status = rotation.status()
+    if status.running:
+        st.write(f'Смена ключа шифрования: перешифровано {status.done} из {status.total}, '
+                 f'осталось {status.remaining}')
+        st.progress(status.done / status.total if status.total else 0.0)
+    elif status.started_at is not None:
+        st.write(f'Последняя смена ключа: перешифровано {status.done} записей')
+    st.button('Сменить ключ шифрования', key='rotate_btn', disabled=status.running,
+              on_click=rotation.start)
+
+@st.fragment
 def render_upload() -> None:    
     with st.form('upload_form'):
         st.header('Загрузить данные')
@@ -136,6 +246,7 @@ def render_upload() -> None:
                 st.session_state['step'] = 'Загрузка данных'
                 st.success('Данные загружены')
 
+@st.fragment
 def render_update() -> None:
     with st.form('update_form'):
         st.header('Обновить данные')
@@ -153,6 +264,7 @@ def render_update() -> None:
                 st.session_state['step'] = 'Обновление данных'
                 st.success('Данные обновлены')
 
+@st.fragment
 def render_get() -> None:
     with st.form('get_form'):
         st.header('Получить данные')
@@ -166,6 +278,7 @@ def render_get() -> None:
             else:
                 st.write(f'Полученные данные по адресу {_id}: {result}')
 
+@st.fragment
 def render_delete() -> None:
     with st.form('delete_form'):
         st.header('Удалить данные')
@@ -180,5 +293,63 @@ def render_delete() -> None:
                 st.session_state['step'] = 'Удаление данных'
                 st.success('Данные удалены')
 
+@st.fragment
+def render_import() -> None:
+    with st.form('import_form'):
+        st.header('Импортировать данные')
+        st.caption('CSV или JSONL с полями id, data, confidential')
+        file = st.file_uploader('Файл с данными', type=['csv', 'jsonl', 'ndjson'],
+                                key='import_file')
+        submit_btn = st.form_submit_button('Импортировать данные')
+        if submit_btn:
+            if file is None:
+                st.error('Выберите файл для импорта!')
+                return
+            try:
+                records = list(parse_records(file, file.name))
+            except (KeyError, ValueError) as e:
+                st.error(f'Не удалось разобрать файл: {e}')
+                return
+            progress_bar = st.progress(0.0, text='Импорт данных...')
+            total = max(len(records), 1)
+            report = import_records(
+                get_memory(), records,
+                progress=lambda done: progress_bar.progress(done / total,
+                                                            text=f'Импортировано {done} из {total}')
+            )
+            st.session_state['step'] = 'Импорт данных'
+            st.success(f'Импортировано записей: {report.processed} за {report.elapsed:.2f} с '
+                       f'({report.rate:.0f} записей/с)')
+            if report.skipped:
+                st.warning(f'Пропущено существующих адресов: {len(report.skipped)}')
+
+@st.fragment
+def render_export() -> None:
+    with st.form('export_form'):
+        st.header('Экспортировать данные')
+        submit_btn = st.form_submit_button('Подготовить экспорт')
+        if submit_btn:
+            progress_bar = st.progress(0.0, text='Экспорт данных...')
+            memory = get_memory()
+            total = max(len(memory), 1)
+            output = io.StringIO()
+            report = export_records(
+                memory, output,
+                progress=lambda done: progress_bar.progress(done / total,
+                                                            text=f'Экспортировано {done} из {total}')
+            )
+            st.session_state['step'] = 'Экспорт данных'
+            st.session_state['export_data'] = output.getvalue()
+            st.success(f'Экспортировано записей: {report.processed} за {report.elapsed:.2f} с')
+    if 'export_data' in st.session_state:
+        st.download_button('Скачать JSONL', data=st.session_state['export_data'],
+                           file_name='memory.jsonl', mime='application/x-ndjson')
+
 
 main_view()
+_elapsed = time.perf_counter() - _script_started
+if not st.session_state.get('first_render_logged'):
+    st.session_state['first_render_logged'] = True
+    logger.info('First render of the session took %.1f ms', _elapsed * 1000)
+else:
+    logger.debug('Rerun took %.1f ms', _elapsed * 1000)
@@ -0,0 +1,81 @@
+from cryptography.fernet import Fernet
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import argparse
+import random
+import time
+
+from store import ShardedStore, create_sharded_store
+
+
+# app.py's upload_data/get_data/update_data/delete_data are thin wrappers
+# over these store methods; importing app.py would start a Streamlit script,
+# so the store is exercised directly.
+def worker(store: ShardedStore, keys: list[str], operations: int, seed: int,
+           confidential_ratio: float) -> dict[str, int]:
+    rng = random.Random(seed)
+    counts = {'get': 0, 'update': 0, 'upload': 0, 'delete': 0}
+    own_keys: list[str] = []
+    for number in range(operations):
+        roll = rng.random()
+        confidential = rng.random() < confidential_ratio
+        if roll < 0.8:
+            store.get(rng.choice(keys))
+            counts['get'] += 1
+        elif roll < 0.9:
+            store.update(rng.choice(keys), f'updated {number}', confidential)
+            counts['update'] += 1
+        elif roll < 0.95 or not own_keys:
+            _id = f'thread-{seed}-{number}'
+            store.upload(_id, f'value {number}', confidential)
+            own_keys.append(_id)
+            counts['upload'] += 1
+        else:
+            store.delete(own_keys.pop())
+            counts['delete'] += 1
+    return counts
+
+
+def run(shards: int, threads: int, entries: int, operations: int, mode: str,
+        confidential_ratio: float) -> float:
+    store = create_sharded_store(mode, Fernet(Fernet.generate_key()), shards)
+    keys = [f'key-{number}' for number in range(entries)]
+    for number, _id in enumerate(keys):
+        store.upload(_id, f'value {number}', number % 2 == 0)
+    start = threading.Barrier(threads + 1)
+
+    def task(seed: int) -> dict[str, int]:
+        start.wait()
+        return worker(store, keys, operations, seed, confidential_ratio)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(task, seed) for seed in range(threads)]
+        start.wait()
+        started = time.perf_counter()
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+    return threads * operations / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Contention of the shared LW5 store')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 16, 32])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--entries', type=int, default=10_000)
+    parser.add_argument('--operations', type=int, default=5_000,
+                        help='operations per thread')
+    parser.add_argument('--mode', choices=['dict', 'compact'], default='dict')
+    parser.add_argument('--confidential-ratio', type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{'shards':>6} {'threads':>7} {'ops/s':>12}")
+    for shards in args.shards:
+        for threads in args.threads:
+            rate = run(shards, threads, args.entries, args.operations, args.mode,
+                       args.confidential_ratio)
+            print(f'{shards:>6} {threads:>7} {rate:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
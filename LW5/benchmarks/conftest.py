@@ -0,0 +1,19 @@
+import pytest
+
+
+def pytest_generate_tests(metafunc):
+    if 'entries' in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption('entries').split(',')]
+        metafunc.parametrize('entries', sizes)
+    if 'mode' in metafunc.fixturenames:
+        metafunc.parametrize('mode', ['dict', 'compact'])
+
+
+@pytest.fixture
+def confidential_ratio(request) -> float:
+    return request.config.getoption('confidential_ratio')
+
+
+@pytest.fixture
+def seed(request) -> int:
+    return request.config.getoption('seed')
@@ -0,0 +1,81 @@
+from cryptography.fernet import Fernet
+from dataclasses import dataclass
+import random
+
+import pytest
+
+from store import MemoryStore, create_store
+
+
+# app.py's data functions only delegate to the store, so the store is
+# measured directly. One round is a pass over every entry; the setup that
+# fills the store is not timed.
+@dataclass
+class Workload:
+    keys: list[str]
+    values: list[str]
+    flags: dict[str, bool]
+    order: list[str]
+
+
+@pytest.fixture
+def workload(entries: int, confidential_ratio: float, seed: int) -> Workload:
+    rng = random.Random(seed)
+    keys = [f'key-{number}' for number in range(entries)]
+    flags = {_id: rng.random() < confidential_ratio for _id in keys}
+    values = [f'value {number} {rng.getrandbits(64):016x}' for number in range(entries)]
+    order = keys[:]
+    rng.shuffle(order)
+    return Workload(keys, values, flags, order)
+
+
+def _filled_store(mode: str, workload: Workload) -> MemoryStore:
+    store = create_store(mode, Fernet(Fernet.generate_key()))
+    for _id, value in zip(workload.keys, workload.values):
+        store.upload(_id, value, workload.flags[_id])
+    return store
+
+
+def _run(benchmark, mode: str, workload: Workload, operation, empty: bool = False) -> None:
+    def setup():
+        store = create_store(mode, Fernet(Fernet.generate_key())) if empty \
+            else _filled_store(mode, workload)
+        return (store,), {}
+
+    benchmark.pedantic(operation, setup=setup, rounds=3)
+    benchmark.extra_info.update(mode=mode, entries=len(workload.keys),
+                                confidential=sum(workload.flags.values()))
+
+
+def test_upload(benchmark, mode, workload):
+    def upload(store: MemoryStore) -> None:
+        for _id, value in zip(workload.keys, workload.values):
+            store.upload(_id, value, workload.flags[_id])
+
+    _run(benchmark, mode, workload, upload, empty=True)
+
+
+def test_get(benchmark, mode, workload):
+    def get(store: MemoryStore) -> None:
+        for _id in workload.order:
+            store.get(_id)
+
+    _run(benchmark, mode, workload, get)
+
+
+def test_update(benchmark, mode, workload):
+    def update(store: MemoryStore) -> None:
+        # Each entry keeps its own flag, so updates never move an entry
+        # between the confidential and the plain path
+        for number, _id in enumerate(workload.order):
+            store.update(_id, f'updated {number}', workload.flags[_id])
+
+    _run(benchmark, mode, workload, update)
+
+
+def test_delete(benchmark, mode, workload):
+    def delete(store: MemoryStore) -> None:
+        for _id in workload.order:
+            store.delete(_id)
+
+    _run(benchmark, mode, workload, delete)
@@ -0,0 +1,140 @@
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import BinaryIO
+import time
+import json
+import csv
+import io
+import os
+
+from store import MemoryStore, ShardedStore
+
+
+Record = tuple[str, str, bool]
+Progress = Callable[[int], None]
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+
+
+@dataclass
+class BulkReport:
+    processed: int = 0
+    skipped: list[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.processed / self.elapsed if self.elapsed > 0 else float(self.processed)
+
+
+def default_workers() -> int:
+    return int(os.getenv('BULK_WORKERS', str(os.cpu_count() or 1)))
+
+
+def _parse_flag(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in _TRUE_VALUES
+
+
+def _field(row: dict, name: str, line: int) -> str:
+    value = row.get(name)
+    # bool is an int subclass, but True as an id or value is a broken file
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f'строка {line}: поле {name} отсутствует или имеет неверный тип')
+    return str(value)
+
+
+def parse_records(file: BinaryIO, name: str) -> Iterator[Record]:
+    # Malformed rows raise ValueError here, before anything reaches the
+    # encryption workers
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    if name.lower().endswith(('.jsonl', '.ndjson')):
+        for number, line in enumerate(text, start=1):
+            if line.strip():
+                item = json.loads(line)
+                if not isinstance(item, dict):
+                    raise ValueError(f'строка {number}: ожидался JSON-объект')
+                yield (_field(item, 'id', number), _field(item, 'data', number),
+                       _parse_flag(item.get('confidential', False)))
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield (_field(row, 'id', reader.line_num), _field(row, 'data', reader.line_num),
+                   _parse_flag(row.get('confidential') or ''))
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _ordered_map(function: Callable[[list], list], chunks: Iterable[list],
+                 workers: int) -> Iterator[list]:
+    # Fernet's AES/HMAC primitives release the GIL, so chunks really run in
+    # parallel. Only a bounded window of chunks is in flight at once.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window = []
+        for chunk in chunks:
+            window.append(pool.submit(function, chunk))
+            if len(window) >= workers * 2:
+                yield window.pop(0).result()
+        for future in window:
+            yield future.result()
+
+
+def import_records(store: MemoryStore | ShardedStore, records: Iterable[Record],
+                   chunk_size: int = 1000, workers: int | None = None,
+                   progress: Progress | None = None) -> BulkReport:
+    def encrypt_chunk(chunk: list[Record]) -> list[tuple[str, bytes, bool]]:
+        return [(_id, store.encrypt(data) if confidential else data.encode(), confidential)
+                for _id, data, confidential in chunk]
+
+    report = BulkReport()
+    started = time.perf_counter()
+    for chunk in _ordered_map(encrypt_chunk, _chunks(records, chunk_size),
+                              workers or default_workers()):
+        for _id, payload, confidential in chunk:
+            try:
+                store.upload_payload(_id, payload, confidential)
+            except KeyError:
+                report.skipped.append(_id)
+            else:
+                report.processed += 1
+        if progress is not None:
+            progress(report.processed + len(report.skipped))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def export_records(store: MemoryStore | ShardedStore, output: io.TextIOBase,
+                   chunk_size: int = 1000, workers: int | None = None,
+                   progress: Progress | None = None) -> BulkReport:
+    def decrypt_chunk(chunk: list[str]) -> list[str]:
+        lines = []
+        for _id in chunk:
+            entry = store.payload(_id)
+            if entry is None:
+                continue
+            payload, confidential = entry
+            data = store.decrypt(payload) if confidential else payload.decode()
+            lines.append(json.dumps({'id': _id, 'data': data, 'confidential': confidential},
+                                    ensure_ascii=False))
+        return lines
+
+    report = BulkReport()
+    started = time.perf_counter()
+    done = 0
+    for chunk_lines in _ordered_map(decrypt_chunk, _chunks(store.keys(), chunk_size),
+                                    workers or default_workers()):
+        for line in chunk_lines:
+            output.write(line + '\n')
+        report.processed += len(chunk_lines)
+        done += chunk_size
+        if progress is not None:
+            progress(min(done, len(store)))
+    report.elapsed = time.perf_counter() - started
+    return report
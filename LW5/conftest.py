@@ -0,0 +1,6 @@
+def pytest_addoption(parser):
+    group = parser.getgroup('lw5 benchmarks')
+    group.addoption('--entries', default='1000,10000,100000',
+                    help='comma separated store sizes; add 1000000 for the full range')
+    group.addoption('--confidential-ratio', type=float, default=0.5)
+    group.addoption('--seed', type=int, default=0)
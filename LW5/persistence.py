@@ -0,0 +1,200 @@
+from collections.abc import Callable, Iterable, Iterator
+import threading
+import struct
+import mmap
+import zlib
+import os
+
+
+# Snapshot layout: header, sorted key bytes, fixed-width index, value blob.
+# The index is searched in place through mmap, so opening a snapshot costs
+# the same regardless of how many entries it holds.
+_MAGIC = b'LW5S'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHHQQQQ')
+_INDEX_ENTRY = struct.Struct('<QIIQQ')
+_FLAG_CONFIDENTIAL = 1
+
+OP_PUT = 1
+OP_DELETE = 2
+_LOG_HEADER = struct.Struct('<BBII')
+_LOG_CRC = struct.Struct('<I')
+
+Entry = tuple[bytes, bool]
+
+
+class MappedSnapshot:
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, keys_offset, index_offset, blob_offset = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a memory snapshot')
+        self._count = count
+        self._keys_offset = keys_offset
+        self._index_offset = index_offset
+        self._blob_offset = blob_offset
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._map)
+
+    def _entry(self, position: int) -> tuple[bytes, int, int, int]:
+        key_offset, key_length, flags, value_offset, value_length = _INDEX_ENTRY.unpack_from(
+            self._map, self._index_offset + position * _INDEX_ENTRY.size
+        )
+        start = self._keys_offset + key_offset
+        return self._map[start:start + key_length], flags, value_offset, value_length
+
+    def lookup(self, key: str) -> Entry | None:
+        target = key.encode()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return None
+        found, flags, value_offset, value_length = self._entry(low)
+        if found != target:
+            return None
+        start = self._blob_offset + value_offset
+        return self._map[start:start + value_length], bool(flags & _FLAG_CONFIDENTIAL)
+
+    def keys(self) -> Iterator[str]:
+        for position in range(self._count):
+            yield self._entry(position)[0].decode()
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+
+class Persistence:
+
+    def __init__(self, directory: str, fsync_interval: float = 1.0) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self._snapshot_path = os.path.join(directory, 'memory.snapshot')
+        self._log_path = os.path.join(directory, 'memory.delta')
+        self._lock = threading.Lock()
+        self._log_fd = os.open(self._log_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+        self._dirty = False
+        self.delta_records = 0
+        self._fsync_interval = fsync_interval
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._start_thread(self._flush_loop, 'memory-delta-fsync')
+
+    def _start_thread(self, target: Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def open_snapshot(self) -> MappedSnapshot | None:
+        if not os.path.exists(self._snapshot_path):
+            return None
+        return MappedSnapshot(self._snapshot_path)
+
+    def replay(self) -> Iterator[tuple[int, str, bytes, bool]]:
+        with open(self._log_path, 'rb') as file:
+            data = file.read()
+        offset = 0
+        while offset + _LOG_HEADER.size <= len(data):
+            op, flags, key_length, value_length = _LOG_HEADER.unpack_from(data, offset)
+            end = offset + _LOG_HEADER.size + key_length + value_length + _LOG_CRC.size
+            if end > len(data):
+                break
+            body = data[offset:end - _LOG_CRC.size]
+            (crc,) = _LOG_CRC.unpack_from(data, end - _LOG_CRC.size)
+            if zlib.crc32(body) != crc:
+                break
+            key_start = offset + _LOG_HEADER.size
+            key = data[key_start:key_start + key_length].decode()
+            value = data[key_start + key_length:key_start + key_length + value_length]
+            yield op, key, value, bool(flags & _FLAG_CONFIDENTIAL)
+            offset = end
+            self.delta_records += 1
+        if offset != len(data):
+            # Drop a torn record left by a crash mid-append
+            os.ftruncate(self._log_fd, offset)
+
+    def _append(self, op: int, key: str, payload: bytes = b'', confidential: bool = False) -> None:
+        encoded_key = key.encode()
+        body = _LOG_HEADER.pack(op, _FLAG_CONFIDENTIAL if confidential else 0,
+                                len(encoded_key), len(payload)) + encoded_key + payload
+        with self._lock:
+            os.write(self._log_fd, body + _LOG_CRC.pack(zlib.crc32(body)))
+            self._dirty = True
+            self.delta_records += 1
+
+    def log_put(self, key: str, payload: bytes, confidential: bool) -> None:
+        self._append(OP_PUT, key, payload, confidential)
+
+    def log_delete(self, key: str) -> None:
+        self._append(OP_DELETE, key)
+
+    def write_snapshot(self, items: Iterable[tuple[str, bytes, bool]]) -> MappedSnapshot:
+        entries = sorted(((key.encode(), payload, confidential)
+                          for key, payload, confidential in items), key=lambda item: item[0])
+        keys_offset = _HEADER.size
+        keys_size = sum(len(key) for key, _, _ in entries)
+        index_offset = keys_offset + keys_size
+        blob_offset = index_offset + len(entries) * _INDEX_ENTRY.size
+        temp_path = f'{self._snapshot_path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(_HEADER.pack(_MAGIC, _VERSION, 0, len(entries),
+                                    keys_offset, index_offset, blob_offset))
+            for key, _, _ in entries:
+                file.write(key)
+            key_offset = value_offset = 0
+            for key, payload, confidential in entries:
+                file.write(_INDEX_ENTRY.pack(key_offset, len(key),
+                                             _FLAG_CONFIDENTIAL if confidential else 0,
+                                             value_offset, len(payload)))
+                key_offset += len(key)
+                value_offset += len(payload)
+            for _, payload, _ in entries:
+                file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        with self._lock:
+            os.replace(temp_path, self._snapshot_path)
+            # Everything in the log is now part of the snapshot
+            os.ftruncate(self._log_fd, 0)
+            os.fsync(self._log_fd)
+            self._dirty = False
+            self.delta_records = 0
+        return MappedSnapshot(self._snapshot_path)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                os.fsync(self._log_fd)
+                self._dirty = False
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self._fsync_interval):
+            self.flush()
+
+    def schedule_snapshots(self, snapshot: Callable[[], None], interval: float) -> None:
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                if self.delta_records:
+                    snapshot()
+
+        self._start_thread(loop, 'memory-snapshot')
+
+    def close(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self.flush()
+        os.close(self._log_fd)
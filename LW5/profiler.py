@@ -0,0 +1,108 @@
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+import tracemalloc
+import threading
+import time
+import os
+
+import psutil
+
+
+@dataclass
+class ProfileSample:
+    timestamp: float
+    rss: int
+    cpu_user: float
+    cpu_system: float
+    cpu_percent: float
+    traced_current: int
+    traced_peak: int
+    top_stats: list[str] = field(default_factory=list)
+    top_diffs: list[str] = field(default_factory=list)
+
+
+class BackgroundProfiler:
+
+    def __init__(self, interval: float = 5.0, frame_depth: int = 1,
+                 include: Iterable[str] = (), top: int = 10, history: int = 120) -> None:
+        self.interval = interval
+        self.frame_depth = frame_depth
+        self.top = top
+        self._filters = [tracemalloc.Filter(True, os.path.join(path, '*')) for path in include]
+        self._history: deque[ProfileSample] = deque(maxlen=history)
+        self._latest: ProfileSample | None = None
+        self._previous: tracemalloc.Snapshot | None = None
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._owns_tracing = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frame_depth)
+            self._owns_tracing = True
+        # The first call only primes psutil's CPU percent counter
+        self._process.cpu_percent(None)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='memory-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        self._previous = None
+
+    def _run(self) -> None:
+        self.sample()
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> ProfileSample:
+        top_stats: list[str] = []
+        top_diffs: list[str] = []
+        traced_current = traced_peak = 0
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            if self._filters:
+                snapshot = snapshot.filter_traces(self._filters)
+            top_stats = [str(stat) for stat in snapshot.statistics('lineno')[:self.top]]
+            if self._previous is not None:
+                top_diffs = [str(stat) for stat in
+                             snapshot.compare_to(self._previous, 'lineno')[:self.top]]
+            self._previous = snapshot
+            traced_current, traced_peak = tracemalloc.get_traced_memory()
+        memory_info = self._process.memory_info()
+        cpu_times = self._process.cpu_times()
+        sample = ProfileSample(
+            timestamp=time.time(),
+            rss=memory_info.rss,
+            cpu_user=cpu_times.user,
+            cpu_system=cpu_times.system,
+            cpu_percent=self._process.cpu_percent(None),
+            traced_current=traced_current,
+            traced_peak=traced_peak,
+            top_stats=top_stats,
+            top_diffs=top_diffs
+        )
+        self._history.append(sample)
+        # Readers only ever see a fully built sample
+        self._latest = sample
+        return sample
+
+    def latest(self) -> ProfileSample | None:
+        return self._latest
+
+    def history(self) -> list[ProfileSample]:
+        return list(self._history)
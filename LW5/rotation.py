@@ -0,0 +1,158 @@
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from collections import deque
+from dataclasses import dataclass
+import threading
+import time
+import os
+
+
+class KeyRing:
+    # The first key encrypts; every key is tried on decrypt, so tokens made
+    # before a rotation stay readable until they are re-encrypted. Dropped
+    # keys are kept in memory (never saved) only to upgrade tokens that a
+    # writer encrypted before the rotation and installs after it.
+
+    def __init__(self, keys: list[bytes]) -> None:
+        if not keys:
+            raise ValueError('KeyRing needs at least one key')
+        self._lock = threading.Lock()
+        self._set_keys(keys, [])
+
+    def _set_keys(self, keys: list[bytes], retired: list[bytes]) -> None:
+        self._primary = Fernet(keys[0])
+        self._cipher = MultiFernet([Fernet(key) for key in keys])
+        self._upgrader = MultiFernet([Fernet(key) for key in [*keys, *retired]])
+        self._retired = list(retired)
+        # Published last: whoever sees the new key list also sees the
+        # ciphers built from it
+        self._keys = list(keys)
+
+    @classmethod
+    def load(cls, path: str | None = None) -> 'KeyRing':
+        if path is None:
+            return cls([Fernet.generate_key()])
+        try:
+            with open(path, 'rb') as file:
+                keys = [line.strip() for line in file if line.strip()]
+        except FileNotFoundError:
+            keys = []
+        if not keys:
+            keyring = cls([Fernet.generate_key()])
+            keyring.save(path)
+            return keyring
+        return cls(keys)
+
+    def save(self, path: str) -> None:
+        temp_path = f'{path}.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(b'\n'.join(self.keys) + b'\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+    @property
+    def keys(self) -> list[bytes]:
+        return list(self._keys)
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self._cipher.encrypt(data)
+
+    def decrypt(self, token: bytes) -> bytes:
+        return self._cipher.decrypt(token)
+
+    def rotate(self, token: bytes) -> bytes:
+        return self._upgrader.rotate(token)
+
+    @property
+    def rotated(self) -> bool:
+        # True once tokens under another key than the primary may exist
+        return len(self._keys) > 1 or bool(self._retired)
+
+    def is_current(self, token: bytes) -> bool:
+        # Checks the HMAC against the primary key without decrypting
+        try:
+            self._primary.extract_timestamp(token)
+        except InvalidToken:
+            return False
+        return True
+
+    def add_key(self, key: bytes) -> None:
+        with self._lock:
+            self._set_keys([key, *self._keys], self._retired)
+
+    def drop_old_keys(self) -> None:
+        with self._lock:
+            self._set_keys(self._keys[:1], [*self._keys[1:], *self._retired])
+
+
+@dataclass
+class RotationStatus:
+    running: bool
+    total: int
+    done: int
+    started_at: float | None
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.done
+
+
+class KeyRotation:
+
+    def __init__(self, store, keyring: KeyRing, key_file: str | None = None,
+                 batch_size: int = 100, pause: float = 0.05) -> None:
+        self._store = store
+        self._keyring = keyring
+        self._key_file = key_file
+        self.batch_size = batch_size
+        self.pause = pause
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._total = 0
+        self._done = 0
+        self._started_at: float | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> RotationStatus:
+        return RotationStatus(self.running, self._total, self._done, self._started_at)
+
+    def start(self, new_key: bytes | None = None) -> bool:
+        with self._lock:
+            if self.running:
+                return False
+            # New writes switch to the new key right away
+            self._keyring.add_key(new_key or Fernet.generate_key())
+            if self._key_file is not None:
+                self._keyring.save(self._key_file)
+            self._total = self._done = 0
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name='key-rotation', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self) -> None:
+        # keys() lists each shard under its lock, so writers that were
+        # installing an old-key token when the new key was added are done by
+        # now; every later writer upgrades its token in _put.
+        pending = deque(_id for _id in self._store.keys() if self._store.is_confidential(_id))
+        self._total = len(pending)
+        self._reencrypt(pending, stale_only=False)
+        # Final check before the old keys go away: anything still under an
+        # old key is re-encrypted under the shard lock
+        self._reencrypt(deque(self._store.keys()), stale_only=True)
+        self._keyring.drop_old_keys()
+        if self._key_file is not None:
+            self._keyring.save(self._key_file)
+
+    def _reencrypt(self, pending: deque[str], stale_only: bool) -> None:
+        while pending:
+            for _ in range(min(self.batch_size, len(pending))):
+                self._store.reencrypt(pending.popleft(), stale_only)
+                if not stale_only:
+                    self._done += 1
+            # Yield between batches so request threads never queue behind us
+            time.sleep(self.pause)
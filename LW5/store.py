@@ -0,0 +1,596 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from collections.abc import Callable
+from array import array
+import threading
+import zlib
+import os
+import base64
+import time
+import sys
+
+from persistence import OP_PUT, MappedSnapshot, Persistence
+
+
+@dataclass(slots=True)
+class Data:
+    data: bytes
+    is_confidential: bool
+
+
+@dataclass
+class StoreStats:
+    mode: str
+    entries: int
+    total_bytes: int
+    # Entries not loaded since the last snapshot live only in the mapped file
+    mapped_bytes: int = 0
+
+    @property
+    def bytes_per_entry(self) -> float:
+        if not self.entries:
+            return 0.0
+        return (self.total_bytes + self.mapped_bytes) / self.entries
+
+
+class DecryptedCache:
+    # Each plaintext is stored with the payload it was decrypted from and is
+    # only returned for that same payload. A reader that decrypted an old
+    # value and puts it after a concurrent update therefore cannot serve
+    # stale data.
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 1 << 20,
+                 ttl: float = 60.0) -> None:
+        self._entries: OrderedDict[str, tuple[float, bytes, bytearray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str, payload: bytes) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, source, value = entry
+            if expires_at < time.monotonic() or source != payload:
+                self._evict(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value.decode()
+
+    def put(self, key: str, payload: bytes, value: str) -> None:
+        encoded = bytearray(value.encode())
+        if len(encoded) > self.max_bytes:
+            return
+        with self._lock:
+            self._evict(key)
+            self._entries[key] = (time.monotonic() + self.ttl, payload, encoded)
+            self._bytes += len(encoded)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._evict(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        value = entry[2]
+        self._bytes -= len(value)
+        # Overwrite the plaintext in place so it does not linger in freed memory
+        value[:] = bytes(len(value))
+
+
+class MemoryStore:
+
+    mode = 'dict'
+
+    def __init__(self, cipher, cache: DecryptedCache | None = None,
+                 persistence: Persistence | None = None) -> None:
+        self._cipher = cipher
+        self._cache = cache
+        self._entries: dict[str, Data] = {}
+        self._lock = threading.RLock()
+        self._persistence = persistence
+        self._snapshot: MappedSnapshot | None = None
+        # Snapshot keys whose snapshot record is no longer authoritative,
+        # because they were loaded into memory, replaced or deleted
+        self._superseded: set[str] = set()
+        if persistence is not None:
+            self._restore()
+
+    @property
+    def cache(self) -> DecryptedCache | None:
+        return self._cache
+
+    @property
+    def cipher(self):
+        return self._cipher
+
+    def __len__(self) -> int:
+        unloaded = len(self._snapshot) - len(self._superseded) if self._snapshot else 0
+        return self._count() + unloaded
+
+    def keys(self) -> list[str]:
+        # Taken under the lock so a writer that is mid-install is either fully
+        # in the list or starts after it
+        with self._lock:
+            keys = self._memory_keys()
+            if self._snapshot is not None:
+                keys.extend(key for key in self._snapshot.keys() if key not in self._superseded)
+            return keys
+
+    def _count(self) -> int:
+        return len(self._entries)
+
+    def _memory_keys(self) -> list[str]:
+        return list(self._entries)
+
+    def _contains(self, _id: str) -> bool:
+        return _id in self._entries
+
+    def _get_entry(self, _id: str) -> tuple[bytes, bool] | None:
+        entry = self._entries.get(_id)
+        return None if entry is None else (entry.data, entry.is_confidential)
+
+    def _set_entry(self, _id: str, payload: bytes, confidential: bool) -> None:
+        self._entries[_id] = Data(payload, confidential)
+
+    def _del_entry(self, _id: str) -> None:
+        del self._entries[_id]
+
+    def _clear_entries(self) -> None:
+        self._entries = {}
+
+    def _entry_flag(self, _id: str) -> bool | None:
+        entry = self._get_entry(_id)
+        return None if entry is None else entry[1]
+
+    def _entry_size(self, _id: str) -> int | None:
+        entry = self._get_entry(_id)
+        return None if entry is None else len(entry[0])
+
+    def _restore(self) -> None:
+        self._snapshot = self._persistence.open_snapshot()
+        for op, _id, payload, confidential in self._persistence.replay():
+            self._materialize(_id)
+            if op == OP_PUT:
+                self._set_entry(_id, payload, confidential)
+            elif self._contains(_id):
+                self._del_entry(_id)
+
+    def _materialize(self, _id: str) -> None:
+        # Values from the mapped snapshot are copied in on first access only
+        if self._snapshot is None or _id in self._superseded or self._contains(_id):
+            return
+        with self._lock:
+            if _id in self._superseded or self._contains(_id):
+                return
+            entry = self._snapshot.lookup(_id)
+            if entry is not None:
+                self._superseded.add(_id)
+                self._set_entry(_id, *entry)
+
+    def snapshot(self) -> None:
+        if self._persistence is None:
+            return
+        with self._lock:
+            items = []
+            for _id in self.keys():
+                entry = self._get_entry(_id)
+                if entry is None:
+                    # Not loaded yet: copy straight from the old snapshot
+                    entry = self._snapshot.lookup(_id)
+                items.append((_id, *entry))
+            previous = self._snapshot
+            self._snapshot = self._persistence.write_snapshot(items)
+            self._superseded = set()
+            self._clear_entries()
+            if previous is not None:
+                previous.close()
+
+    def footprint(self) -> int:
+        total = sys.getsizeof(self._entries)
+        for key, entry in self._entries.items():
+            total += sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry.data)
+        return total
+
+    def mapped_bytes(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.nbytes if snapshot is not None else 0
+
+    def memory_stats(self) -> StoreStats:
+        with self._lock:
+            return StoreStats(self.mode, len(self), self.footprint(), self.mapped_bytes())
+
+    def _read(self, read: Callable[[str], object], _id: str):
+        self._materialize(_id)
+        result = read(_id)
+        if result is None and self._snapshot is not None:
+            # snapshot() may have cleared the loaded entries between the two
+            # calls above; retry under the lock, where the state is settled
+            with self._lock:
+                self._materialize(_id)
+                result = read(_id)
+        return result
+
+    def exists(self, _id: str) -> bool:
+        return self._read(self._entry_flag, _id) is not None
+
+    def is_confidential(self, _id: str) -> bool | None:
+        return self._read(self._entry_flag, _id)
+
+    def size(self, _id: str) -> int | None:
+        return self._read(self._entry_size, _id)
+
+    def encrypt(self, data: str) -> bytes:
+        # Fernet tokens are base64 text; only the raw token bytes are kept
+        return base64.urlsafe_b64decode(self._cipher.encrypt(data.encode()))
+
+    def decrypt(self, payload: bytes) -> str:
+        return self._cipher.decrypt(base64.urlsafe_b64encode(payload)).decode()
+
+    def get(self, _id: str) -> str | None:
+        entry = self.payload(_id)
+        if entry is None:
+            return None
+        payload, confidential = entry
+        if not confidential:
+            return payload.decode()
+        if self._cache is not None:
+            cached = self._cache.get(_id, payload)
+            if cached is not None:
+                return cached
+        value = self.decrypt(payload)
+        if self._cache is not None:
+            self._cache.put(_id, payload, value)
+        return value
+
+    def payload(self, _id: str) -> tuple[bytes, bool] | None:
+        return self._read(self._get_entry, _id)
+
+    def _current_payload(self, payload: bytes) -> bytes:
+        # A writer may have encrypted before a key rotation started (bulk
+        # import encrypts chunks well ahead of installing them). Upgrading the
+        # token here, under the lock, means no old-key token is installed once
+        # the rotation has listed the keys.
+        if not getattr(self._cipher, 'rotated', False):
+            return payload
+        token = base64.urlsafe_b64encode(payload)
+        if self._cipher.is_current(token):
+            return payload
+        return base64.urlsafe_b64decode(self._cipher.rotate(token))
+
+    def _put(self, _id: str, payload: bytes, confidential: bool) -> None:
+        if confidential:
+            payload = self._current_payload(payload)
+        if self._cache is not None:
+            self._cache.invalidate(_id)
+        self._set_entry(_id, payload, confidential)
+        if self._persistence is not None:
+            self._persistence.log_put(_id, payload, confidential)
+
+    def upload_payload(self, _id: str, payload: bytes, confidential: bool) -> None:
+        with self._lock:
+            if self.exists(_id):
+                raise KeyError('Данные по данному идентификатору уже существуют!')
+            self._put(_id, payload, confidential)
+
+    def upload(self, _id: str, data: str, confidential: bool = False) -> None:
+        payload = self.encrypt(data) if confidential else data.encode()
+        self.upload_payload(_id, payload, confidential)
+
+    def update(self, _id: str, data: str, confidential: bool = False) -> None:
+        payload = self.encrypt(data) if confidential else data.encode()
+        with self._lock:
+            if not self.exists(_id):
+                raise KeyError('Данных по данному адресу не существует!')
+            self._put(_id, payload, confidential)
+
+    def reencrypt(self, _id: str, stale_only: bool = False) -> bool:
+        if stale_only:
+            with self._lock:
+                entry = self.payload(_id)
+                if entry is None or not entry[1]:
+                    return False
+                rotated = self._current_payload(entry[0])
+                if rotated is entry[0]:
+                    return False
+                self._install_rotated(_id, rotated)
+            return True
+        entry = self.payload(_id)
+        if entry is None or not entry[1]:
+            return False
+        payload = entry[0]
+        rotated = base64.urlsafe_b64decode(self._cipher.rotate(base64.urlsafe_b64encode(payload)))
+        with self._lock:
+            # Skip if a writer replaced the value meanwhile: the new key was
+            # added before this read, so _put gave that writer's token the new key
+            if self._get_entry(_id) != (payload, True):
+                return False
+            self._install_rotated(_id, rotated)
+        return True
+
+    def _install_rotated(self, _id: str, payload: bytes) -> None:
+        self._set_entry(_id, payload, True)
+        if self._persistence is not None:
+            self._persistence.log_put(_id, payload, True)
+
+    def delete(self, _id: str) -> None:
+        with self._lock:
+            if not self.exists(_id):
+                raise KeyError('Данных по данному адресу не существует!')
+            if self._cache is not None:
+                self._cache.invalidate(_id)
+            self._del_entry(_id)
+            if self._persistence is not None:
+                self._persistence.log_delete(_id)
+
+    def zeroize_cache(self) -> None:
+        if self._cache is not None:
+            self._cache.clear()
+
+    def schedule_snapshots(self, interval: float) -> None:
+        if self._persistence is not None:
+            self._persistence.schedule_snapshots(self.snapshot, interval)
+
+
+class CompactMemoryStore(MemoryStore):
+    # All payloads live back to back in one bytearray arena. A key maps to a
+    # slot; the slot's offset and length sit in typed arrays and the
+    # confidential flag is one bit in a bitset.
+
+    mode = 'compact'
+
+    def __init__(self, cipher, cache: DecryptedCache | None = None,
+                 persistence: Persistence | None = None,
+                 compact_ratio: float = 0.5, compact_min_bytes: int = 1 << 16) -> None:
+        self._compact_ratio = compact_ratio
+        self._compact_min_bytes = compact_min_bytes
+        self._clear_entries()
+        super().__init__(cipher, cache, persistence)
+
+    def _clear_entries(self) -> None:
+        self._slots: dict[str, int] = {}
+        self._free_slots: list[int] = []
+        self._offsets = array('Q')
+        self._lengths = array('I')
+        self._flags = bytearray()
+        self._arena = bytearray()
+        self._garbage = 0
+
+    def _count(self) -> int:
+        return len(self._slots)
+
+    def _memory_keys(self) -> list[str]:
+        return list(self._slots)
+
+    def _flag(self, slot: int) -> bool:
+        return bool(self._flags[slot >> 3] & (1 << (slot & 7)))
+
+    def _set_flag(self, slot: int, value: bool) -> None:
+        if value:
+            self._flags[slot >> 3] |= 1 << (slot & 7)
+        else:
+            self._flags[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+
+    def _contains(self, _id: str) -> bool:
+        return _id in self._slots
+
+    # Slot reads take the lock: compaction moves payloads and snapshot()
+    # swaps in empty buffers, so a slot is only valid with the buffers it
+    # was read with
+    def _entry_flag(self, _id: str) -> bool | None:
+        with self._lock:
+            slot = self._slots.get(_id)
+            return None if slot is None else self._flag(slot)
+
+    def _get_entry(self, _id: str) -> tuple[bytes, bool] | None:
+        with self._lock:
+            slot = self._slots.get(_id)
+            if slot is None:
+                return None
+            offset = self._offsets[slot]
+            payload = bytes(self._arena[offset:offset + self._lengths[slot]])
+            return payload, self._flag(slot)
+
+    def _entry_size(self, _id: str) -> int | None:
+        with self._lock:
+            slot = self._slots.get(_id)
+            return None if slot is None else self._lengths[slot]
+
+    def _set_entry(self, _id: str, payload: bytes, confidential: bool) -> None:
+        slot = self._slots.get(_id)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = len(self._offsets)
+                self._offsets.append(0)
+                self._lengths.append(0)
+                if slot >> 3 >= len(self._flags):
+                    self._flags.append(0)
+            self._slots[_id] = slot
+        else:
+            self._garbage += self._lengths[slot]
+        self._offsets[slot] = len(self._arena)
+        self._lengths[slot] = len(payload)
+        self._set_flag(slot, confidential)
+        self._arena += payload
+        self._maybe_compact()
+
+    def _del_entry(self, _id: str) -> None:
+        slot = self._slots.pop(_id)
+        self._garbage += self._lengths[slot]
+        self._lengths[slot] = 0
+        self._set_flag(slot, False)
+        self._free_slots.append(slot)
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if (len(self._arena) >= self._compact_min_bytes
+                and self._garbage >= len(self._arena) * self._compact_ratio):
+            self.compact()
+
+    def compact(self) -> None:
+        arena = bytearray()
+        for slot in self._slots.values():
+            offset = self._offsets[slot]
+            self._offsets[slot] = len(arena)
+            arena += self._arena[offset:offset + self._lengths[slot]]
+        self._arena = arena
+        self._garbage = 0
+
+    def footprint(self) -> int:
+        total = sys.getsizeof(self._slots) + sum(sys.getsizeof(key) for key in self._slots)
+        total += sys.getsizeof(self._free_slots)
+        for buffer in (self._offsets, self._lengths, self._flags, self._arena):
+            total += sys.getsizeof(buffer)
+        return total
+
+
+def create_store(mode: str, cipher, cache: DecryptedCache | None = None,
+                 persistence: Persistence | None = None) -> MemoryStore:
+    if mode == CompactMemoryStore.mode:
+        return CompactMemoryStore(cipher, cache, persistence)
+    if mode == MemoryStore.mode:
+        return MemoryStore(cipher, cache, persistence)
+    raise ValueError(f'Unknown memory store mode: {mode}')
+
+
+class ShardedStore:
+    # Keys are spread over independent shards by a stable hash. Each shard has
+    # its own lock, so writers only block the shard they touch, and reads
+    # decrypt outside of any lock.
+
+    def __init__(self, shards: list[MemoryStore]) -> None:
+        self._shards = shards
+
+    @property
+    def shards(self) -> list[MemoryStore]:
+        return self._shards
+
+    @property
+    def mode(self) -> str:
+        return f'{self._shards[0].mode} x{len(self._shards)}'
+
+    @property
+    def cipher(self):
+        return self._shards[0].cipher
+
+    def _shard(self, _id: str) -> MemoryStore:
+        return self._shards[zlib.crc32(_id.encode()) % len(self._shards)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def keys(self) -> list[str]:
+        return [key for shard in self._shards for key in shard.keys()]
+
+    def exists(self, _id: str) -> bool:
+        return self._shard(_id).exists(_id)
+
+    def is_confidential(self, _id: str) -> bool | None:
+        return self._shard(_id).is_confidential(_id)
+
+    def size(self, _id: str) -> int | None:
+        return self._shard(_id).size(_id)
+
+    def encrypt(self, data: str) -> bytes:
+        return self._shards[0].encrypt(data)
+
+    def decrypt(self, payload: bytes) -> str:
+        return self._shards[0].decrypt(payload)
+
+    def get(self, _id: str) -> str | None:
+        return self._shard(_id).get(_id)
+
+    def payload(self, _id: str) -> tuple[bytes, bool] | None:
+        return self._shard(_id).payload(_id)
+
+    def upload_payload(self, _id: str, payload: bytes, confidential: bool) -> None:
+        self._shard(_id).upload_payload(_id, payload, confidential)
+
+    def upload(self, _id: str, data: str, confidential: bool = False) -> None:
+        self._shard(_id).upload(_id, data, confidential)
+
+    def update(self, _id: str, data: str, confidential: bool = False) -> None:
+        self._shard(_id).update(_id, data, confidential)
+
+    def delete(self, _id: str) -> None:
+        self._shard(_id).delete(_id)
+
+    def reencrypt(self, _id: str, stale_only: bool = False) -> bool:
+        return self._shard(_id).reencrypt(_id, stale_only)
+
+    def footprint(self) -> int:
+        return sum(shard.footprint() for shard in self._shards)
+
+    def mapped_bytes(self) -> int:
+        return sum(shard.mapped_bytes() for shard in self._shards)
+
+    def memory_stats(self) -> StoreStats:
+        stats = [shard.memory_stats() for shard in self._shards]
+        return StoreStats(self.mode, sum(item.entries for item in stats),
+                          sum(item.total_bytes for item in stats),
+                          sum(item.mapped_bytes for item in stats))
+
+    def zeroize_cache(self) -> None:
+        for shard in self._shards:
+            shard.zeroize_cache()
+
+    def snapshot(self) -> None:
+        for shard in self._shards:
+            shard.snapshot()
+
+    def schedule_snapshots(self, interval: float) -> None:
+        for shard in self._shards:
+            shard.schedule_snapshots(interval)
+
+
+def create_sharded_store(mode: str, cipher, shards: int,
+                         cache_factory: Callable[[int], DecryptedCache | None] | None = None,
+                         persist_dir: str | None = None) -> ShardedStore:
+    if shards < 1:
+        raise ValueError('shards must be positive')
+    if persist_dir is not None:
+        # Routing depends on the shard count, so it must not change between runs
+        layout_path = os.path.join(persist_dir, 'shards')
+        if os.path.exists(layout_path):
+            with open(layout_path) as file:
+                stored = int(file.read())
+            if stored != shards:
+                raise ValueError(f'{persist_dir} was written with {stored} shards, not {shards}')
+        else:
+            os.makedirs(persist_dir, exist_ok=True)
+            with open(layout_path, 'w') as file:
+                file.write(str(shards))
+    stores = []
+    for index in range(shards):
+        cache = cache_factory(shards) if cache_factory is not None else None
+        persistence = None
+        if persist_dir is not None:
+            persistence = Persistence(os.path.join(persist_dir, f'shard-{index:02d}'))
+        stores.append(create_store(mode, cipher, cache, persistence))
+    return ShardedStore(stores)
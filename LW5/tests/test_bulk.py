@@ -0,0 +1,51 @@
+from cryptography.fernet import Fernet
+import io
+
+import pytest
+
+from bulk import import_records, parse_records
+from store import create_store
+
+
+def _parse(content: str, name: str) -> list[tuple[str, str, bool]]:
+    return list(parse_records(io.BytesIO(content.encode('utf-8')), name))
+
+
+def test_csv_rows_are_parsed():
+    content = 'id,data,confidential\r\na,первый,да\r\nb,"с, запятой",\r\n'
+    assert _parse(content, 'records.csv') == [('a', 'первый', True), ('b', 'с, запятой', False)]
+
+
+def test_jsonl_rows_are_parsed():
+    content = '{"id": "a", "data": "x", "confidential": true}\n\n{"id": 7, "data": 1.5}\n'
+    assert _parse(content, 'records.jsonl') == [('a', 'x', True), ('7', '1.5', False)]
+
+
+def test_short_csv_row_is_rejected_with_its_line():
+    content = 'id,data,confidential\na,first,no\nb\nc,third,no\n'
+    records = parse_records(io.BytesIO(content.encode()), 'records.csv')
+    assert next(records) == ('a', 'first', False)
+    with pytest.raises(ValueError, match='строка 3'):
+        next(records)
+
+
+@pytest.mark.parametrize('line', [
+    '["a", "x"]',
+    '"just a string"',
+    '{"id": "a"}',
+    '{"id": null, "data": "x"}',
+    '{"id": true, "data": "x"}',
+    '{"id": "a", "data": {"nested": 1}}',
+])
+def test_malformed_jsonl_row_is_rejected(line):
+    with pytest.raises(ValueError, match='строка 2'):
+        _parse('{"id": "ok", "data": "x"}\n' + line + '\n', 'records.jsonl')
+
+
+def test_short_csv_row_stops_the_import_before_it():
+    store = create_store('dict', Fernet(Fernet.generate_key()))
+    content = 'id,data,confidential\na,first,yes\nb\n'
+    with pytest.raises(ValueError):
+        import_records(store, parse_records(io.BytesIO(content.encode()), 'records.csv'),
+                       chunk_size=1, workers=1)
+    assert store.get('b') is None
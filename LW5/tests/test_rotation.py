@@ -0,0 +1,89 @@
+from cryptography.fernet import Fernet, InvalidToken
+import base64
+import time
+
+import pytest
+
+from bulk import import_records
+from rotation import KeyRing, KeyRotation
+from store import ShardedStore, create_sharded_store
+
+
+RECORDS = [(f'key-{number}', f'value {number}', number % 3 != 0) for number in range(300)]
+
+
+class RotateDuringInstall:
+    # Stands in for the store handed to import_records. Right before the
+    # chosen install it runs a whole rotation, so payloads that were already
+    # encrypted under the old key are installed after that key was dropped.
+
+    def __init__(self, store: ShardedStore, rotation: KeyRotation, at: int) -> None:
+        self._store = store
+        self._rotation = rotation
+        self._at = at
+        self._installs = 0
+
+    def __getattr__(self, name: str):
+        return getattr(self._store, name)
+
+    def upload_payload(self, _id: str, payload: bytes, confidential: bool) -> None:
+        if self._installs == self._at:
+            assert self._rotation.start()
+            while self._rotation.running:
+                time.sleep(0.001)
+        self._installs += 1
+        self._store.upload_payload(_id, payload, confidential)
+
+
+@pytest.fixture
+def keyring() -> KeyRing:
+    return KeyRing([Fernet.generate_key()])
+
+
+@pytest.fixture
+def store(keyring) -> ShardedStore:
+    return create_sharded_store('dict', keyring, 4)
+
+
+@pytest.mark.parametrize('at', [0, 150])
+def test_rotation_during_import_leaves_every_entry_readable(store, keyring, at):
+    old_key = keyring.keys[0]
+    rotation = KeyRotation(store, keyring, batch_size=50, pause=0)
+    # One chunk holds every record, so all of them are encrypted under the
+    # old key before the rotation starts
+    report = import_records(RotateDuringInstall(store, rotation, at), RECORDS,
+                            chunk_size=len(RECORDS), workers=1)
+
+    assert report.processed == len(RECORDS)
+    assert old_key not in keyring.keys
+    for _id, data, confidential in RECORDS:
+        assert store.get(_id) == data
+        payload, stored_confidential = store.payload(_id)
+        assert stored_confidential == confidential
+        if confidential:
+            assert keyring.is_current(base64.urlsafe_b64encode(payload))
+
+
+def test_old_key_tokens_are_not_readable_once_dropped(keyring):
+    # Guards the test above: it only proves something if a token under a
+    # dropped key really cannot be decrypted by the ring any more
+    token = keyring.encrypt(b'secret')
+    keyring.add_key(Fernet.generate_key())
+    keyring.drop_old_keys()
+    with pytest.raises(InvalidToken):
+        keyring.decrypt(token)
+    assert keyring.decrypt(keyring.rotate(token)) == b'secret'
+
+
+def test_rotation_reencrypts_existing_entries(store, keyring):
+    for _id, data, confidential in RECORDS:
+        store.upload(_id, data, confidential)
+    rotation = KeyRotation(store, keyring, batch_size=50, pause=0)
+    assert rotation.start()
+    while rotation.running:
+        time.sleep(0.001)
+
+    assert len(keyring.keys) == 1
+    assert rotation.status().done == sum(confidential for _, _, confidential in RECORDS)
+    for _id, data, _ in RECORDS:
+        assert store.get(_id) == data
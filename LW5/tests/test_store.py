@@ -0,0 +1,120 @@
+from cryptography.fernet import Fernet
+import threading
+
+import pytest
+
+from persistence import Persistence
+from store import DecryptedCache, MemoryStore, create_store
+
+
+@pytest.fixture
+def persistence(tmp_path):
+    persistence = Persistence(str(tmp_path))
+    yield persistence
+    persistence.close()
+
+
+@pytest.fixture(params=['dict', 'compact'])
+def persisted_store(request, persistence) -> MemoryStore:
+    store = create_store(request.param, Fernet(Fernet.generate_key()), persistence=persistence)
+    for number in range(100):
+        store.upload(f'key-{number}', f'value {number}', number % 2 == 0)
+    return store
+
+
+def _snapshot_after_materialize(store: MemoryStore) -> list[str]:
+    # Runs a snapshot in the window between a reader loading the entry and
+    # looking it up, which is where readers used to see a false miss
+    materialize = store._materialize
+    swapped = []
+
+    def materialize_then_snapshot(_id: str) -> None:
+        materialize(_id)
+        if not swapped:
+            swapped.append(_id)
+            thread = threading.Thread(target=store.snapshot)
+            thread.start()
+            thread.join()
+
+    store._materialize = materialize_then_snapshot
+    return swapped
+
+
+@pytest.mark.parametrize('read', ['get', 'exists', 'is_confidential', 'size', 'payload'])
+def test_reads_do_not_miss_while_a_snapshot_is_swapped_in(persisted_store, read):
+    persisted_store.get('key-2')
+    swapped = _snapshot_after_materialize(persisted_store)
+
+    result = getattr(persisted_store, read)('key-2')
+
+    assert swapped == ['key-2']
+    assert result not in (None, False)
+    assert persisted_store.get('key-2') == 'value 2'
+
+
+def test_readers_running_during_snapshots_see_every_key(persisted_store):
+    stop = threading.Event()
+    misses = []
+
+    def reader() -> None:
+        while not stop.is_set():
+            for number in range(100):
+                if persisted_store.get(f'key-{number}') != f'value {number}':
+                    misses.append(number)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for _ in range(20):
+        persisted_store.snapshot()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert misses == []
+
+
+def test_memory_stats_count_the_mapped_snapshot(persisted_store):
+    before = persisted_store.memory_stats()
+    persisted_store.snapshot()
+    after = persisted_store.memory_stats()
+
+    assert after.entries == before.entries == 100
+    assert after.mapped_bytes > 0
+    assert after.bytes_per_entry > 0.5 * after.mapped_bytes / after.entries
+    persisted_store.get('key-1')
+    assert persisted_store.memory_stats().mapped_bytes == after.mapped_bytes
+
+
+@pytest.mark.parametrize('mode', ['dict', 'compact'])
+def test_cache_does_not_keep_a_value_decrypted_before_an_update(mode):
+    store = create_store(mode, Fernet(Fernet.generate_key()), DecryptedCache())
+    store.upload('key', 'old', True)
+    decrypt = store.decrypt
+    updated = []
+
+    def decrypt_then_update(payload: bytes) -> str:
+        # The reader has decrypted the old payload but not cached it yet when
+        # a writer replaces the value
+        value = decrypt(payload)
+        if not updated:
+            updated.append(payload)
+            thread = threading.Thread(target=store.update, args=('key', 'new', True))
+            thread.start()
+            thread.join()
+        return value
+
+    store.decrypt = decrypt_then_update
+    assert store.get('key') == 'old'
+    assert updated
+    assert store.get('key') == 'new'
+    assert store.get('key') == 'new'
+
+
+def test_cache_treats_another_payload_as_a_miss():
+    cache = DecryptedCache()
+    cache.put('key', b'first', 'old')
+    assert cache.get('key', b'second') is None
+    assert len(cache) == 0
+    cache.put('key', b'second', 'new')
+    assert cache.get('key', b'second') == 'new'
+    assert (cache.hits, cache.misses) == (1, 1)